@@ -0,0 +1,10 @@
+"""
+Benchmarks for the GMDC parse, convert and write paths.
+
+    python -m benchmarks.corpus     OUTDIR      write a synthetic corpus
+    python -m benchmarks.bench_gmdc             time every pipeline stage
+    python -m benchmarks.bench_memory           memory held by 10k scanned files
+    python -m benchmarks.bench_topology         welding on degenerate meshes
+
+All of them run without Blender.
+"""
@@ -0,0 +1,208 @@
+"""
+Times every stage of the GMDC pipeline on synthetic files.
+
+Each case is built through GMDC.build_data, written to a temporary file
+and parsed back section by section. Stage timings are the best of
+--repeat runs; peak memory comes from a separate tracemalloc run so it
+does not slow the timed ones down.
+MB/s is the number of bytes a stage wrote or parsed over its time, stages
+that don't touch the file format have none.
+
+    python -m benchmarks.bench_gmdc --output new.json --compare old.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from io_sims2gmdc.rcol.gmdc import GMDC
+from io_sims2gmdc.blender_model import BlenderModel
+from .corpus import CorpusCase, make_models
+
+
+STAGES = ['build', 'write', 'read_file', 'header', 'elements', 'linkages', 'groups',
+            'model', 'subsets', 'groups_from_gmdc']
+
+
+def run_stages(case, path, stage_done):
+    """
+    Run the whole pipeline once, calling stage_done(name, size) after each
+    stage. Size is the number of file bytes the stage wrote or parsed, None
+    for stages that don't touch the file format.
+    """
+    b_models, bones, boundmesh, riggedbounds = make_models(case)
+    stage_done(None)
+
+    gmdc_data = GMDC.build_data(case.name, b_models, bones, boundmesh, riggedbounds)
+    stage_done('build')
+    gmdc_data.write(path)
+    stage_done('write', os.path.getsize(path))
+    del gmdc_data, b_models
+
+    gmdc_data = GMDC.from_file_data(path)
+    stage_done('read_file', len(gmdc_data.data_read.file_data))
+    for name, load in [
+        ('header',      gmdc_data.load_header),
+        ('elements',    gmdc_data.load_elements),
+        ('linkages',    gmdc_data.load_linkages),
+        ('groups',      gmdc_data.load_groups),
+        ('model',       gmdc_data.load_model),
+        ('subsets',     gmdc_data.load_subsets),
+    ]:
+        start = gmdc_data.data_read.tell()
+        load()
+        stage_done(name, gmdc_data.data_read.tell() - start)
+    list( BlenderModel.groups_from_gmdc(gmdc_data) )
+    stage_done('groups_from_gmdc')
+
+
+def time_case(case, path, repeat):
+    """Returns the best time and the size of every stage"""
+    best = {}
+    sizes = {}
+    for i in range(repeat):
+        last = [time.perf_counter()]
+
+        def stage_done(name, size=None):
+            now = time.perf_counter()
+            if name:
+                best[name] = min(best.get(name, float('inf')), now - last[0])
+                sizes[name] = size
+            last[0] = time.perf_counter()
+
+        run_stages(case, path, stage_done)
+    return best, sizes
+
+
+def trace_case(case, path):
+    peaks = {}
+
+    def stage_done(name, size=None):
+        if name:
+            peaks[name] = tracemalloc.get_traced_memory()[1]
+        # Python 3.9+, before that peaks add up over the stages
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+
+    tracemalloc.start()
+    try:
+        run_stages(case, path, stage_done)
+    finally:
+        tracemalloc.stop()
+    return peaks
+
+
+def bench_case(case, repeat, trace):
+    handle, path = tempfile.mkstemp(suffix='.5gd')
+    os.close(handle)
+    try:
+        seconds, sizes = time_case(case, path, repeat)
+        file_size = os.path.getsize(path)
+        peaks = trace_case(case, path) if trace else {}
+    finally:
+        os.remove(path)
+
+    result = {'vertices': case.vertices, 'file_bytes': file_size, 'stages': {}}
+    for stage in STAGES:
+        size = sizes[stage]
+        result['stages'][stage] = {
+            'seconds':          round(seconds[stage], 6),
+            'bytes':            size,
+            'mb_per_s':         None if size is None else round(size / 1e6 / max(seconds[stage], 1e-9), 3),
+            'vertices_per_s':   round(case.vertices / max(seconds[stage], 1e-9)),
+            'peak_bytes':       peaks.get(stage),
+        }
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold):
+    """Return (case, stage, old seconds, new seconds) for every regression"""
+    regressions = []
+    for name, case in results['cases'].items():
+        old_case = baseline['cases'].get(name)
+        if not old_case:
+            continue
+        for stage, values in case['stages'].items():
+            old = old_case['stages'].get(stage)
+            if old and values['seconds'] > old['seconds'] * (1 + threshold):
+                regressions.append( (name, stage, old['seconds'], values['seconds']) )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark GMDC parsing, conversion and writing.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 500000])
+    parser.add_argument('--variants', nargs='+', default=['static', 'bones+morphs+tangents'],
+                        help='\'static\' or features joined by +, see benchmarks.corpus')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--no-trace', action='store_true', help='skip peak memory measurements')
+    parser.add_argument('--output', help='write results to this JSON file')
+    parser.add_argument('--compare', help='earlier results JSON to check for regressions')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='slowdown ratio flagged as a regression, 0.25 means 25%% slower')
+    args = parser.parse_args(argv)
+
+    results = {
+        'commit':   git_commit(),
+        'date':     time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python':   platform.python_version(),
+        'numpy':    np.__version__,
+        'cases':    {},
+    }
+
+    for size in args.sizes:
+        for variant in args.variants:
+            case = CorpusCase.from_name(size, variant)
+            # GMDC prints its progress, keep the table readable
+            stdout = sys.stdout
+            sys.stdout = open(os.devnull, 'w')
+            try:
+                result = bench_case(case, args.repeat, not args.no_trace)
+            finally:
+                sys.stdout.close()
+                sys.stdout = stdout
+            results['cases'][case.name] = result
+
+            print(case.name, '(' + str(result['file_bytes']) + ' bytes)')
+            for stage, values in result['stages'].items():
+                peak = values['peak_bytes']
+                rate = values['mb_per_s']
+                print('    {:<18}{:>10.4f} s{:>10} MB/s{:>12} peak'.format(
+                    stage, values['seconds'], '-' if rate is None else '{:.1f}'.format(rate),
+                    '-' if peak is None else str(peak // 1024) + ' KiB'))
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, args.threshold)
+        for name, stage, old, new in regressions:
+            print('REGRESSION', name, stage, old, '->', new, 's')
+        if regressions:
+            return 1
+        print('No regressions against', args.compare)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,179 @@
+"""
+Memory held by many scanned or parsed GMDCs.
+
+Keeps the results for --files files alive and reports the traced memory
+per file. The held objects are then copied twice, once as they are and
+once into plain dict-backed twins of their classes. Both copies share
+every array, string and number, so the difference between them is what
+the __slots__ declarations save.
+
+    python -m benchmarks.bench_memory --files 10000
+    python -m benchmarks.bench_memory --files 1000 --stage models
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import tracemalloc
+
+from io_sims2gmdc.rcol.gmdc import GMDC
+from io_sims2gmdc.rcol.lazy_section import LazySection
+from io_sims2gmdc.blender_model import BlenderModel
+from io_sims2gmdc.bone_data import BoneData
+from .corpus import CorpusCase, build_gmdc
+
+
+def scan(path):
+    return GMDC.scan(path)
+
+
+def load(path):
+    gmdc_data = GMDC.from_file_data(path)
+    gmdc_data.load_header()
+    gmdc_data.load_data()
+    return [gmdc_data.header, gmdc_data.elements, gmdc_data.linkages,
+            gmdc_data.groups, gmdc_data.model, gmdc_data.subsets]
+
+
+def models(path):
+    gmdc_data = GMDC.from_file_data(path)
+    gmdc_data.load_header()
+    gmdc_data.load_data()
+    bones = BoneData.build_bones(gmdc_data) if gmdc_data.model.transforms else []
+    return [list( BlenderModel.groups_from_gmdc(gmdc_data) ), bones]
+
+
+STAGES = {
+    'scan':     scan,
+    'load':     load,
+    'models':   models,
+}
+
+
+def slot_names(cls):
+    names = []
+    for base in cls.__mro__:
+        names.extend( getattr(base, '__slots__', ()) )
+    return names
+
+
+def copy_objects(value, classes):
+    """
+    Copy the object graph, instances of a class in classes become instances
+    of the class it maps to. Any other value is shared with the original.
+    """
+    if isinstance(value, list):
+        return [copy_objects(v, classes) for v in value]
+    if type(value) not in classes:
+        return value
+
+    copy = object.__new__( classes[type(value)] )
+    for name in slot_names(type(value)):
+        # object.__setattr__ skips RawBlock, which would drop raw
+        object.__setattr__(copy, name, copy_objects(getattr(value, name), classes))
+    return copy
+
+
+def slotted_classes(held):
+    classes = set()
+
+    def visit(value):
+        if isinstance(value, list):
+            for v in value:
+                visit(v)
+        elif hasattr(type(value), '__slots__') and type(value) not in classes:
+            classes.add(type(value))
+            for name in slot_names(type(value)):
+                visit(getattr(value, name))
+
+    visit(held)
+    classes.discard(LazySection)
+    return classes
+
+
+def traced(function):
+    """Returns (result, bytes it still holds)"""
+    start = tracemalloc.get_traced_memory()[0]
+    result = function()
+    return result, tracemalloc.get_traced_memory()[0] - start
+
+
+def write_corpus(directory, sizes, variants):
+    paths = []
+    for size in sizes:
+        for variant in variants:
+            case = CorpusCase.from_name(size, variant)
+            path = os.path.join(directory, case.name + '.5gd')
+            build_gmdc(case).write(path)
+            paths.append(path)
+    return paths
+
+
+def bench(paths, files, stage):
+    read = STAGES[stage]
+
+    tracemalloc.start()
+    try:
+        held, held_bytes = traced( lambda: [read(paths[i % len(paths)]) for i in range(files)] )
+
+        classes = slotted_classes(held)
+        same = {cls: cls for cls in classes}
+        twins = {cls: type(cls.__name__, (), {}) for cls in classes}
+
+        slotted_copy, slotted_bytes = traced( lambda: copy_objects(held, same) )
+        del slotted_copy
+        dict_copy, dict_bytes = traced( lambda: copy_objects(held, twins) )
+        del dict_copy
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'stage':                stage,
+        'files':                files,
+        'held_bytes':           held_bytes,
+        'bytes_per_file':       held_bytes // files,
+        'classes':              sorted(cls.__name__ for cls in classes),
+        'slotted_object_bytes': slotted_bytes,
+        'dict_object_bytes':    dict_bytes,
+        'saved_bytes_per_file': (dict_bytes - slotted_bytes) // files,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure memory held by many scanned or parsed GMDCs.')
+    parser.add_argument('--files', type=int, default=10000)
+    parser.add_argument('--stage', choices=list(STAGES), default='scan')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000])
+    parser.add_argument('--variants', nargs='+', default=['static', 'bones+morphs+tangents'])
+    parser.add_argument('--output', help='write results to this JSON file')
+    args = parser.parse_args(argv)
+
+    directory = tempfile.mkdtemp()
+    # GMDC prints its progress, keep the results readable
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        paths = write_corpus(directory, args.sizes, args.variants)
+        result = bench(paths, args.files, args.stage)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+        shutil.rmtree(directory)
+
+    print(result['files'], 'files,', result['stage'])
+    print('    held                {:>12} KiB{:>10} bytes per file'.format(
+            result['held_bytes'] // 1024, result['bytes_per_file']))
+    print('    slotted objects     {:>12} KiB'.format(result['slotted_object_bytes'] // 1024))
+    print('    dict-backed objects {:>12} KiB'.format(result['dict_object_bytes'] // 1024))
+    print('    saved by __slots__  {:>12} bytes per file'.format(result['saved_bytes_per_file']))
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(result, file, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
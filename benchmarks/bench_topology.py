@@ -0,0 +1,142 @@
+"""
+Welding and hard edge detection on degenerate meshes.
+
+Flat shaded meshes repeat a handful of normals on every vertex and
+stacked or collapsed geometry puts many vertices at one spot. Both fill
+single cells of the neighbour search in topology.cluster_ids with
+thousands of rows. A case that goes over --max-seconds or --max-mb, or
+finds the wrong number of distinct values, is reported as a regression.
+
+    python -m benchmarks.bench_topology --vertices 20000
+"""
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from io_sims2gmdc.topology import HardEdges, WeldedMesh, cluster_ids, NORMAL_DISTANCE
+
+
+def hard_edges(positions, normals, faces):
+    """Returns the number of distinct normals"""
+    HardEdges.from_mesh(positions, normals, faces)
+    return int(cluster_ids(normals, NORMAL_DISTANCE).max()) + 1
+
+
+def weld(positions, faces):
+    """Returns the number of distinct positions"""
+    return int(WeldedMesh.from_mesh(positions, faces).position_ids.max()) + 1
+
+
+def make_mesh(vertices, seed=0):
+    """Random positions, and faces made of consecutive vertices"""
+    rng = np.random.default_rng(seed)
+    positions = rng.random((vertices, 3))
+    faces = np.arange(vertices // 3 * 3).reshape(-1, 3)
+    return rng, positions, faces
+
+
+def flat_normals(vertices):
+    """Every vertex uses one of the 6 normals of a box"""
+    rng, positions, faces = make_mesh(vertices)
+    box = np.concatenate( (np.eye(3), -np.eye(3)) )
+    normals = box[ np.repeat(rng.integers(0, len(box), len(faces)), 3) ]
+    normals = np.concatenate( (normals, box[:vertices - len(normals)]) )
+    return lambda: hard_edges(positions, normals, faces), len(box)
+
+
+def noisy_normals(vertices):
+    """Flat normals with float noise, as written by other exporters"""
+    rng, positions, faces = make_mesh(vertices)
+    box = np.concatenate( (np.eye(3), -np.eye(3)) )
+    normals = box[ rng.integers(0, len(box), vertices) ] + rng.normal(0, 1e-6, (vertices, 3))
+    normals[:len(box)] = box
+    return lambda: hard_edges(positions, normals, faces), len(box)
+
+
+def coincident(vertices):
+    """Every vertex at the same spot, all faces collapse"""
+    rng, positions, faces = make_mesh(vertices)
+    positions[:] = (0.5, 0.5, 0.5)
+    return lambda: weld(positions, faces), 1
+
+
+def stacked(vertices):
+    """A few spots, each shared by a large part of the vertices"""
+    rng, positions, faces = make_mesh(vertices)
+    spots = rng.random((4, 3))
+    positions = spots[ rng.integers(0, len(spots), vertices) ]
+    positions[:len(spots)] = spots
+    return lambda: weld(positions, faces), len(spots)
+
+
+CASES = {
+    'flat_normals':     flat_normals,
+    'noisy_normals':    noisy_normals,
+    'coincident':       coincident,
+    'stacked':          stacked,
+}
+
+
+def bench_case(make, vertices):
+    run, expected = make(vertices)
+
+    start = time.perf_counter()
+    result = run()
+    seconds = time.perf_counter() - start
+
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'seconds':      round(seconds, 6),
+        'peak_bytes':   peak,
+        'result':       result,
+        'expected':     expected,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time welding and hard edges on degenerate meshes.')
+    parser.add_argument('--vertices', type=int, nargs='+', default=[20000])
+    parser.add_argument('--cases', nargs='+', choices=list(CASES), default=list(CASES))
+    parser.add_argument('--max-seconds', type=float, default=2.0)
+    parser.add_argument('--max-mb', type=float, default=256.0)
+    parser.add_argument('--output', help='write results to this JSON file')
+    args = parser.parse_args(argv)
+
+    results = {}
+    failures = 0
+    for vertices in args.vertices:
+        for name in args.cases:
+            result = bench_case(CASES[name], vertices)
+            results[name + '_' + str(vertices)] = result
+
+            problems = []
+            if result['result'] != result['expected']:
+                problems.append('{} clusters, expected {}'.format(result['result'], result['expected']))
+            if result['seconds'] > args.max_seconds:
+                problems.append('slower than ' + str(args.max_seconds) + ' s')
+            if result['peak_bytes'] > args.max_mb * 1e6:
+                problems.append('more than ' + str(args.max_mb) + ' MB')
+            failures += bool(problems)
+
+            print('    {:<24}{:>10.4f} s{:>12} KiB peak  {}'.format(
+                name + ' ' + str(vertices), result['seconds'], result['peak_bytes'] // 1024,
+                'REGRESSION ' + ', '.join(problems) if problems else 'ok'))
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
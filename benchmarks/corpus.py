@@ -0,0 +1,152 @@
+"""
+Synthetic GMDC generator.
+
+Builds BlenderModels filled with random geometry and turns them into a
+GMDC through GMDC.build_data, the same path the exporter takes.
+"""
+import argparse
+import os
+
+import numpy as np
+
+from io_sims2gmdc.rcol.gmdc import GMDC
+from io_sims2gmdc.blender_model import BlenderModel
+from io_sims2gmdc.bone_data import BoneData
+from io_sims2gmdc.morphmap import MorphMap
+
+
+# Face lists hold 16 bit vertex indices, bigger meshes are split into groups
+MAX_GROUP_VERTICES = 0xFFFF
+
+FEATURES = ('bones', 'morphs', 'tangents')
+
+
+class CorpusCase:
+
+    def __init__(self, vertices, bones=False, morphs=False, tangents=False):
+        self.vertices   = vertices
+        self.bones      = bones
+        self.morphs     = morphs
+        self.tangents   = tangents
+
+
+    @staticmethod
+    def from_name(vertices, variant):
+        """Variant is 'static' or features joined by '+', e.g. 'bones+morphs'"""
+        features = [] if variant == 'static' else variant.split('+')
+        for feature in features:
+            if feature not in FEATURES:
+                raise ValueError('Unknown corpus feature ' + feature)
+        return CorpusCase(vertices, *[f in features for f in FEATURES])
+
+
+    @property
+    def name(self):
+        features = [f for f in FEATURES if getattr(self, f)]
+        return 'v' + str(self.vertices) + '-' + ('+'.join(features) or 'static')
+
+
+class SyntheticBounds:
+    """Stands in for rcol.boundmesh.BoundMesh, which needs Blender"""
+
+    def __init__(self, vertices, faces):
+        self.vertices   = vertices
+        self.faces      = faces
+
+
+def make_bones():
+    bones = []
+    for name, parent, subset in BoneData.bone_parent_table:
+        position = (0.0, 0.0, 0.01 * subset)
+        rotation = (1.0, 0.0, 0.0, 0.0)
+        bones.append(BoneData(name, parent, subset, position, rotation))
+    return bones
+
+
+def make_bounds(rng, vertex_count):
+    vertices = rng.random((vertex_count, 3), dtype=np.float32)
+    faces = rng.integers(0, vertex_count, size=(vertex_count * 2, 3))
+    return SyntheticBounds(vertices, faces)
+
+
+def make_model(rng, name, vertex_count, case, bone_count):
+    vertices = rng.random((vertex_count, 3), dtype=np.float32)
+    normals = rng.standard_normal((vertex_count, 3)).astype(np.float32)
+    normals /= np.linalg.norm(normals, axis=1)[:, None]
+    uvs = rng.random((vertex_count, 2), dtype=np.float32)
+    faces = rng.integers(0, vertex_count, size=(vertex_count * 2, 3))
+
+    tangents = []
+    if case.tangents:
+        tangents = np.cross(normals, (0, 0, 1)).astype(np.float32)
+
+    bone_assign = []
+    bone_weight = []
+    if case.bones:
+        bone_assign = np.full((vertex_count, 4), 255, dtype=np.uint8)
+        bone_assign[:, :2] = rng.integers(0, bone_count, size=(vertex_count, 2))
+        bone_weight = np.zeros((vertex_count, 3), dtype=np.float32)
+        bone_weight[:, 0] = rng.random(vertex_count, dtype=np.float32)
+        bone_weight[:, 1] = 1 - bone_weight[:, 0]
+
+    morphs = []
+    morph_bytemap = None
+    if case.morphs:
+        for morphname in ('botmorphs, fatbot', 'botmorphs, pregbot'):
+            deltas = rng.random((vertex_count, 3), dtype=np.float32) * 0.01
+            ndeltas = rng.random((vertex_count, 3), dtype=np.float32) * 0.01
+            morphs.append( MorphMap(morphname, deltas, ndeltas) )
+        morph_bytemap = np.zeros((vertex_count, 4), dtype=np.uint8)
+        morph_bytemap[:, :2] = (1, 2)
+
+    return BlenderModel(vertices, normals, tangents, faces, uvs, name,
+                        bone_assign, bone_weight, -1, morphs, morph_bytemap)
+
+
+def make_models(case, seed=0):
+    """Returns the (b_models, bones, boundmesh, riggedbounds) for a case"""
+    rng = np.random.default_rng(seed)
+    bones = make_bones() if case.bones else None
+    bone_count = len(bones) if bones else 0
+
+    b_models = []
+    remaining = case.vertices
+    while remaining > 0:
+        vertex_count = min(remaining, MAX_GROUP_VERTICES)
+        name = 'group' + str(len(b_models))
+        b_models.append( make_model(rng, name, vertex_count, case, bone_count) )
+        remaining -= vertex_count
+
+    boundmesh = None
+    riggedbounds = None
+    if bones:
+        riggedbounds = [make_bounds(rng, 8) for b in bones]
+    else:
+        boundmesh = make_bounds(rng, 64)
+
+    return b_models, bones, boundmesh, riggedbounds
+
+
+def build_gmdc(case, seed=0):
+    b_models, bones, boundmesh, riggedbounds = make_models(case, seed)
+    return GMDC.build_data(case.name, b_models, bones, boundmesh, riggedbounds)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Write a synthetic GMDC corpus.')
+    parser.add_argument('output', help='directory to write the .5gd files to')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 500000])
+    parser.add_argument('--variants', nargs='+', default=['static', 'bones+morphs+tangents'],
+                        help='\'static\' or features from ' + ', '.join(FEATURES) + ' joined by +')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.output, exist_ok=True)
+    for size in args.sizes:
+        for variant in args.variants:
+            case = CorpusCase.from_name(size, variant)
+            build_gmdc(case, args.seed).write( os.path.join(args.output, case.name + '.5gd') )
+
+
+if __name__ == '__main__':
+    main()
@@ -16,26 +16,33 @@ Created by SmugTomato
     You should have received a copy of the GNU General Public License
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 '''
-import bpy
-from bpy_extras.io_utils import ImportHelper
-from bpy.props import StringProperty, BoolProperty, EnumProperty
-from bpy.types import Operator
-from bpy.props import PointerProperty
-
-from .blender_import import ImportGMDC
-from .blender_export import ExportGMDC
-from .ui_panel       import(PROP_GmdcSettings,
-                            OP_AddMorph,
-                            OP_UpdateNeckFix,
-                            OP_UpdateMorphNames,
-                            OP_HideShadows,
-                            OP_UnhideShadows,
-                            OP_HideArmature,
-                            OP_UnHideArmature,
-                            OP_SyncMorphs,
-                            OP_AddGMDCParams,
-                            OP_NormalsToVertexColor,
-                            GmdcPanel)
+try:
+    import bpy
+except ImportError:
+    # Running outside of Blender, e.g. from the batch tools in main.py.
+    # Only the rcol core and the pure data modules can be used then.
+    bpy = None
+
+if bpy is not None:
+    from bpy_extras.io_utils import ImportHelper
+    from bpy.props import StringProperty, BoolProperty, EnumProperty
+    from bpy.types import Operator
+    from bpy.props import PointerProperty
+
+    from .blender_import import ImportGMDC, ImportGMDCBatch
+    from .blender_export import ExportGMDC
+    from .ui_panel       import(PROP_GmdcSettings,
+                                OP_AddMorph,
+                                OP_UpdateNeckFix,
+                                OP_UpdateMorphNames,
+                                OP_HideShadows,
+                                OP_UnhideShadows,
+                                OP_HideArmature,
+                                OP_UnHideArmature,
+                                OP_SyncMorphs,
+                                OP_AddGMDCParams,
+                                OP_NormalsToVertexColor,
+                                GmdcPanel)
 
 
 bl_info = {
@@ -47,26 +54,30 @@ bl_info = {
 	"description": "Importer and exporter for Sims 2 GMDC(.5gd) files"
 }
 
-classes = [
-    ImportGMDC,
-    ExportGMDC,
-	GmdcPanel,
-	OP_AddMorph,
-	OP_UpdateMorphNames,
-	OP_UpdateNeckFix,
-	OP_HideShadows,
-	OP_UnhideShadows,
-	OP_HideArmature,
-	OP_UnHideArmature,
-	OP_SyncMorphs,
-	OP_AddGMDCParams,
-	OP_NormalsToVertexColor,
-	PROP_GmdcSettings
-]
+classes = []
+if bpy is not None:
+    classes = [
+        ImportGMDC,
+        ImportGMDCBatch,
+        ExportGMDC,
+        GmdcPanel,
+        OP_AddMorph,
+        OP_UpdateMorphNames,
+        OP_UpdateNeckFix,
+        OP_HideShadows,
+        OP_UnhideShadows,
+        OP_HideArmature,
+        OP_UnHideArmature,
+        OP_SyncMorphs,
+        OP_AddGMDCParams,
+        OP_NormalsToVertexColor,
+        PROP_GmdcSettings
+    ]
 
 
 def menu_func_im(self, context):
     self.layout.operator(ImportGMDC.bl_idname)
+    self.layout.operator(ImportGMDCBatch.bl_idname)
 
 def menu_func_ex(self, context):
     self.layout.operator(ExportGMDC.bl_idname)
@@ -18,12 +18,14 @@ Created by SmugTomato
 '''
 import bpy
 import bmesh
+import numpy as np
 from bpy_extras.io_utils import ExportHelper
 from bpy.props import StringProperty, BoolProperty, EnumProperty
 from bpy.types import Operator
 from mathutils import Vector, Quaternion, Color
 
 from .rcol.gmdc import GMDC
+from .rcol.metrics import Metrics, stage
 from .blender_model import BlenderModel
 from .morphmap import MorphMap
 from .bone_data import BoneData
@@ -46,8 +48,47 @@ class ExportGMDC(Operator, ExportHelper):
             maxlen=255,  # Max internal buffer length, longer would be clamped.
             )
 
+    normals_mode = EnumProperty(
+            name="Normals",
+            description="Where to take the exported normals from",
+            items=(
+                ('CUSTOM', "Custom split normals",
+                    "Use the mesh's custom split normals, or the '__NORMALS__' layer of meshes without any"),
+                ('COLORS', "Vertex colors",
+                    "Use the '__NORMALS__' vertex color layer, if the mesh has one"),
+                ('NONE', "Calculated",
+                    "Use the normals Blender calculates"),
+            ),
+            default='CUSTOM',
+            )
+
+    do_metrics = BoolProperty(
+            name="[DEBUG] Record metrics",
+            description="Write per stage timings and memory use next to the exported file",
+            default=False,
+            )
+
+    do_profile = BoolProperty(
+            name="[DEBUG] Profile",
+            description="Also write a cProfile dump next to the exported file",
+            default=False,
+            )
+
 
     def execute(self, context):
+        metrics = None
+        if self.do_metrics or self.do_profile:
+            metrics = Metrics(profile=self.do_profile)
+
+        try:
+            with stage(metrics, 'export'):
+                return self.export_gmdc(context, metrics)
+        finally:
+            if metrics:
+                metrics.save(self.filepath)
+
+
+    def export_gmdc(self, context, metrics):
         bpy.ops.object.mode_set(mode='OBJECT')
 
         # Select objects to export depending on user choice
@@ -89,22 +130,31 @@ class ExportGMDC(Operator, ExportHelper):
         # Continue export process
         b_models = []
         for ob in obs_to_export:
-            b_models.append( ExportGMDC.build_group(ob, armature, bones) )
+            with stage(metrics, 'build_group') as record:
+                b_models.append( ExportGMDC.build_group(ob, armature, bones, self.normals_mode) )
+                record['vertices'] = len(b_models[-1].vertices)
 
         # Create bounding mesh(es)
         boundmesh = None
         riggedbounds = None
-        if not armature:
-            if custom_bounds:
-                boundmesh = BoundMesh.create(obs_to_export, custom=custom_bounds)
+        with stage(metrics, 'bounds'):
+            if not armature:
+                if custom_bounds:
+                    boundmesh = BoundMesh.create(obs_to_export, custom=custom_bounds)
+                else:
+                    boundmesh = BoundMesh.create(obs_to_export)
             else:
-                boundmesh = BoundMesh.create(obs_to_export)
-        else:
-            # BUGGED FOR SIM MESHES
-            riggedbounds = self.create_riggedbounds(obs_to_export, bones)
-
-        # Build gmdc
-        gmdc_data = GMDC.build_data(filename, b_models, bones, boundmesh, riggedbounds)
+                # BUGGED FOR SIM MESHES
+                riggedbounds = self.create_riggedbounds(obs_to_export, bones)
+
+        # Build gmdc, write records its stages in the same metrics
+        try:
+            gmdc_data = GMDC.build_data(filename, b_models, bones, boundmesh, riggedbounds,
+                                        metrics=metrics)
+        except ValueError as error:
+            # Meshes the format can't hold, like too many vertices for a face list
+            self.report({'ERROR'}, str(error))
+            return {'CANCELLED'}
 
         # Write data
         gmdc_data.write(self.filepath)
@@ -172,7 +222,77 @@ class ExportGMDC(Operator, ExportHelper):
 
 
     @staticmethod
-    def build_group(object, armature, bones):
+    def normals_from_split(mesh):
+        """
+        Replace normals with the custom split normals of the mesh,
+        loops sharing a vertex get their average
+        """
+        if not mesh.has_custom_normals:
+            return
+
+        mesh.calc_normals_split()
+        loop_normals = np.empty(len(mesh.loops) * 3, dtype=np.float32)
+        mesh.loops.foreach_get("normal", loop_normals)
+        loop_vertices = np.empty(len(mesh.loops), dtype=np.int32)
+        mesh.loops.foreach_get("vertex_index", loop_vertices)
+        mesh.free_normals_split()
+
+        normals = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+        mesh.vertices.foreach_get("normal", normals)
+        normals = normals.reshape(-1, 3)
+
+        # Vertices without loops keep their own normal
+        total = np.zeros_like(normals)
+        np.add.at(total, loop_vertices, loop_normals.reshape(-1, 3))
+        lengths = np.linalg.norm(total, axis=1)
+        used = lengths > 0
+        normals[used] = total[used] / lengths[used, np.newaxis]
+
+        mesh.vertices.foreach_set("normal", normals.reshape(-1))
+
+
+    @staticmethod
+    def replace_normals(mesh, normals_mode):
+        if normals_mode == 'CUSTOM' and mesh.has_custom_normals:
+            ExportGMDC.normals_from_split(mesh)
+        elif normals_mode != 'NONE':
+            ExportGMDC.normals_from_colors(mesh)
+
+
+    @staticmethod
+    def foreach_array(collection, attribute, width=1, dtype=np.float32):
+        """attribute of every item in collection, (n, width) unless width is 1"""
+        values = np.empty(len(collection) * width, dtype=dtype)
+        collection.foreach_get(attribute, values)
+        return values if width == 1 else values.reshape(-1, width)
+
+
+    @staticmethod
+    def normalized(vectors):
+        """Rows scaled to unit length, zero length ones are left as they are"""
+        lengths = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return np.divide(vectors, lengths, out=np.array(vectors), where=lengths > 0)
+
+
+    @staticmethod
+    def orthogonal(vectors):
+        """
+        Vectors perpendicular to each row, the same ones Vector.orthogonal
+        gives: the largest component is repeated on all axes and its own
+        axis is set to cancel out the others
+        """
+        rows = np.arange(len(vectors))
+        x, y, z = np.abs(vectors).T
+        axis = np.where(x > y, np.where(x > z, 0, 2), np.where(y > z, 1, 2))
+
+        dominant = vectors[rows, axis]
+        result = np.repeat(dominant[:, np.newaxis], 3, axis=1)
+        result[rows, axis] = dominant - vectors.sum(axis=1)
+        return result
+
+
+    @staticmethod
+    def build_group(object, armature, bones, normals_mode='COLORS'):
         neckfix_type = object.get("neck_fix")
 
 
@@ -220,47 +340,37 @@ class ExportGMDC(Operator, ExportHelper):
         bm.to_mesh(mesh)
         bm.free()
 
-        ExportGMDC.normals_from_colors(mesh)
+        ExportGMDC.replace_normals(mesh, normals_mode)
 
-        vertices    = []
-        normals     = []
         tangents    = []
-        uvs         = []
-        faces       = []
         bone_assign = []
         bone_weight = []
         name        = object.name
         opacity     = object.get("opacity", -1)
 
-        # Vertices, normals and pre-populating uvs
-        for vert in mesh.vertices:
-            vertices.append( (-vert.co[0], -vert.co[1], vert.co[2]) )
-            vert.normal.normalize()
-            normals.append( (-vert.normal[0], -vert.normal[1], vert.normal[2]) )
+        # Every attribute is read in a single foreach_get
+        co              = ExportGMDC.foreach_array(mesh.vertices, "co", 3)
+        vert_normals    = ExportGMDC.foreach_array(mesh.vertices, "normal", 3)
+        loop_starts     = ExportGMDC.foreach_array(mesh.polygons, "loop_start", dtype=np.int32)
+        loop_vertices   = ExportGMDC.foreach_array(mesh.loops, "vertex_index", dtype=np.int32)
+        loop_uvs        = ExportGMDC.foreach_array(mesh.uv_layers.active.data, "uv", 2)
 
+        # Normalized normals go back into the mesh, morphs are compared to them
+        vert_normals = ExportGMDC.normalized(vert_normals)
+        mesh.vertices.foreach_set("normal", vert_normals.reshape(-1))
 
-            # c1 = vert.normal.cross(Vector( (0,1,0) )).normalized()
-            # c2 = vert.normal.cross(Vector( (0,0,1) )).normalized()
-            #
-            # if c1.length > c2.length:
-            #     tangents.append(c1)
-            # else:
-            #     tangents.append(c2)
-
-
-            # print(tan)
-            # uvs.append( None )
+        # Vertices and normals, with X and Y flipped
+        vertices    = co * BlenderModel.AXIS_FLIP
+        normals     = vert_normals * BlenderModel.AXIS_FLIP
 
         # Tangents
         if object.get("calc_tangents") != None and object.get("is_shadow") == False:
-            for vert in mesh.vertices:
-                tan = vert.normal.orthogonal().normalized()
-                tangents.append( (tan[0], tan[1], tan[2]) )
+            tangents = ExportGMDC.normalized( ExportGMDC.orthogonal(vert_normals) )
 
 
-        # Faces
-        for f in mesh.polygons:
-            faces.append( (f.vertices[0], f.vertices[1], f.vertices[2]) )
+        # Faces, the mesh is triangulated so every polygon has 3 loops
+        face_loops = loop_starts[:, np.newaxis] + np.arange(3, dtype=np.int32)
+        faces = loop_vertices[face_loops]
 
 
         # Tangents
@@ -274,15 +384,11 @@ class ExportGMDC(Operator, ExportHelper):
         #         print(tan, vert.tangent)
 
 
-        # UVs
-        uvs = [None]*len(vertices)
-        uv_layer = mesh.uv_layers[0]
-        for i, polygon in enumerate(mesh.polygons):
-            for j, loopindex in enumerate(polygon.loop_indices):
-                meshuvloop = mesh.uv_layers.active.data[loopindex]
-                uv = ( meshuvloop.uv[0], -meshuvloop.uv[1] + 1 )
-                vertidx = faces[i][j]
-                uvs[vertidx] = uv
+        # UVs, each vertex takes the UV of a loop using it. Flip v back
+        loops = face_loops.reshape(-1)
+        uvs = np.zeros((len(vertices), 2), dtype=np.float32)
+        uvs[loop_vertices[loops]] = loop_uvs[loops]
+        uvs[:,1] = 1 - uvs[:,1]
 
 
         # TEMPORARY FIX FOR BAD BONE ASSIGNMENTS IN SIMS
@@ -340,7 +446,7 @@ class ExportGMDC(Operator, ExportHelper):
                 morph_bm.free()
 
                 # Replace normals
-                ExportGMDC.normals_from_colors(morphmesh)
+                ExportGMDC.replace_normals(morphmesh, normals_mode)
 
 				# Create morph and remove copied mesh
                 morphs.append( MorphMap.from_blender(mesh, morphmesh, key.name) )
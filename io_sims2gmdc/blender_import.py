@@ -16,21 +16,27 @@ Created by SmugTomato
     You should have received a copy of the GNU General Public License
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 '''
+import os
 import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 import bpy, math
-import bmesh
+import numpy as np
 from mathutils import Vector, Matrix, Quaternion
 from bpy_extras.io_utils import ImportHelper
-from bpy.props import StringProperty, BoolProperty, EnumProperty
-from bpy.types import Operator
+from bpy.props import StringProperty, BoolProperty, EnumProperty, IntProperty, CollectionProperty
+from bpy.types import Operator, OperatorFileListElement
 from rna_prop_ui import rna_idprop_ui_prop_get
 
 from .rcol.gmdc import GMDC
+from .rcol.metrics import Metrics, stage
+from .model_cache import ModelCache
 # from .rcol.rcol_data import Rcol
 # from .rcol.data_helper import DataHelper
 from . import blender_model
 from .bone_data import BoneData
 from . import neckfixes
+from . import topology
 
 class ImportGMDC(Operator, ImportHelper):
     """Sims 2 GMDC Importer"""
@@ -53,26 +59,104 @@ class ImportGMDC(Operator, ImportHelper):
             default=True,
             )
 
+    do_shadows = BoolProperty(
+            name="Import shadows",
+            description="Import shadow groups",
+            default=True,
+            )
+
+    group_names = StringProperty(
+            name="Groups",
+            description="Comma separated names of the groups to import, all of them if left empty",
+            default="",
+            )
+
+    cache_directory = StringProperty(
+            name="Cache directory",
+            description="Keep the converted groups of imported files here and reuse them "
+                        "when the same file is imported again. No cache if left empty",
+            subtype='DIR_PATH',
+            default="",
+            )
+
+    cache_size = IntProperty(
+            name="Cache size (MiB)",
+            description="Least recently used entries are removed once the cache grows beyond this",
+            default=512,
+            min=1,
+            )
+
     do_bounddebug = BoolProperty(
             name="[DEBUG] Bound mesh",
             description="Import bounding mesh",
             default=False,
             )
 
+    normals_mode = EnumProperty(
+            name="Original normals",
+            description="How to keep the normals stored in the file",
+            items=(
+                ('CUSTOM', "Custom split normals",
+                    "Apply them as the mesh's custom split normals, read back on export"),
+                ('COLORS', "Vertex colors",
+                    "Store them on the '__NORMALS__' vertex color layer, read back on export"),
+                ('NONE', "Discard",
+                    "Let Blender calculate the normals"),
+            ),
+            default='CUSTOM',
+            )
+
     do_neckdebug = BoolProperty(
             name="[DEBUG] Neck normals",
             description="Lookup neck vertex normals",
             default=False,
             )
 
+    do_metrics = BoolProperty(
+            name="[DEBUG] Record metrics",
+            description="Write per stage timings and memory use next to the imported file",
+            default=False,
+            )
+
+    do_profile = BoolProperty(
+            name="[DEBUG] Profile",
+            description="Also write a cProfile dump next to the imported file",
+            default=False,
+            )
+
     def execute(self, context):
-        gmdc_data = GMDC.from_file_data(self.filepath)
+        metrics = None
+        if self.do_metrics or self.do_profile:
+            metrics = Metrics(profile=self.do_profile)
+
+        try:
+            with stage(metrics, 'import'):
+                return self.import_gmdc(context, metrics)
+        finally:
+            if metrics:
+                metrics.save(self.filepath)
+
+
+    def import_gmdc(self, context, metrics):
+        # Mapped and lazily loaded, only the elements of the group being
+        # imported are decoded at any time
+        gmdc_data = GMDC.from_file_data(self.filepath, use_mmap=True, metrics=metrics,
+                                        cache=self.model_cache())
+        try:
+            return self.import_groups(gmdc_data, metrics)
+        finally:
+            gmdc_data.close()
+
+
+    def import_groups(self, gmdc_data, metrics):
         if gmdc_data.load_header() == False:
-            print ('Unsupported GMDC version', hex(gmdc_data.header.file_type))
-            return False
+            print (gmdc_data.unsupported_reason())
+            return {'CANCELLED'}
 
-        gmdc_data.load_data()
-        b_models = blender_model.BlenderModel.groups_from_gmdc(gmdc_data)
+        gmdc_data.load_data(lazy=True)
+        b_models = blender_model.BlenderModel.groups_from_gmdc(
+            gmdc_data, self.selected_groups()
+        )
 
 
         # Container for all groups and their armature, keeps the scene clean
@@ -87,13 +171,14 @@ class ImportGMDC(Operator, ImportHelper):
 
 
         if self.do_neckdebug:
-            self.debug_necknormals(b_models[0])
+            self.debug_necknormals( next(b_models) )
             return {'FINISHED'}
 
 
         armature = None
         if self.do_skeleton and gmdc_data.model.transforms:
-            armature = self.import_skeleton(gmdc_data)
+            with stage(metrics, 'skeleton', objects=len(gmdc_data.model.transforms)):
+                armature = self.import_skeleton(gmdc_data)
             armature.parent = container
 
 
@@ -105,24 +190,39 @@ class ImportGMDC(Operator, ImportHelper):
 
 
 
-        if b_models != False:
-            for model in b_models:
-                print( self.do_import(model, armature, container) )
+        bone_names = self.bone_names(armature) if armature else None
+        for model in b_models:
+            with stage(metrics, 'do_import', vertices=len(model.vertices)):
+                print( self.do_import(model, armature, container, bone_names) )
 
         bpy.ops.object.select_all(action='DESELECT')
 
         return {'FINISHED'}
 
 
+    def model_cache(self):
+        """ModelCache for the cache options, or None"""
+        if not self.cache_directory:
+            return None
+        return ModelCache(bpy.path.abspath(self.cache_directory),
+                            self.cache_size * 1024 * 1024)
+
+
+    def selected_groups(self):
+        """Group filter for the groups and shadow options"""
+        names = [name.strip() for name in self.group_names.split(',') if name.strip()]
+        return blender_model.BlenderModel.group_filter(names, self.do_shadows)
+
+
     def parse_data(self, context, filepath):
         gmdc_data = GMDC.from_file_data(context, filepath)
 
         if gmdc_data.load_header() == False:
-            print ('Unsupported GMDC version', hex(gmdc_data.header.file_type))
+            print (gmdc_data.unsupported_reason())
             return False
 
         gmdc_data.load_data()
-        b_models = blender_model.BlenderModel.groups_from_gmdc(gmdc_data)
+        b_models = list( blender_model.BlenderModel.groups_from_gmdc(gmdc_data) )
         return b_models
 
 
@@ -193,7 +293,28 @@ class ImportGMDC(Operator, ImportHelper):
             area.tag_redraw()
 
 
-    def do_import(self, b_model, armature, container):
+    @staticmethod
+    def morph_error(morph, vertex_count):
+        """Reason a morph can't be loaded as a shape key, or None"""
+        if morph.deltas is None:
+            return 'no vertex deltas are linked to this group'
+        if np.shape(morph.deltas) != (vertex_count, 3):
+            return ('it has ' + str(len(morph.deltas)) + ' deltas for '
+                    + str(vertex_count) + ' vertices')
+        return None
+
+
+    @staticmethod
+    def bone_names(armature):
+        """Vertex group name for every bone index"""
+        # If it's a sim skeleton, use boneparent table
+        # Otherwise use bone names
+        if len(armature.data.bones) == 65:
+            return [nameset[0] for nameset in BoneData.bone_parent_table]
+        return [bone.name for bone in armature.data.bones]
+
+
+    def do_import(self, b_model, armature, container, bone_names=None):
         print('Importing group: \'', b_model.name, '\'', sep='')
 
 
@@ -240,23 +361,11 @@ class ImportGMDC(Operator, ImportHelper):
         )
 
 
-        # Load vertices and faces
-        mesh.from_pydata(b_model.vertices, [], b_model.faces)
-
-
-        # Load normals
-        for i, vert in enumerate(mesh.vertices):
-            vert.normal = b_model.normals[i]
-
-
-        # Create UV layer and load UV coordinates
-        mesh.uv_layers.new(name = 'UVMap')
-        for i, polygon in enumerate(mesh.polygons):
-            for j, loopindex in enumerate(polygon.loop_indices):
-                meshuvloop = mesh.uv_layers.active.data[loopindex]
-
-                vertex_index = b_model.faces[i][j]
-                meshuvloop.uv = b_model.uvs[vertex_index]
+        # Weld split vertices and drop loose ones, then load vertices, faces,
+        # normals and UV coordinates. Everything per vertex is gathered
+        # through the welded mesh's source indices from here on.
+        welded = topology.WeldedMesh.from_mesh(b_model.vertices, b_model.faces)
+        self.load_geometry(mesh, b_model, welded)
 
 
         # Load bone assignments and weights
@@ -280,25 +389,13 @@ class ImportGMDC(Operator, ImportHelper):
 
 
             print('Applying bone weights...')
-            for i in range(len(b_model.bone_assign)):
-                remainder = 1.0     # Used for an implied 4th bone weight
-                # print(i, b_model.bone_assign[i])
-                for j in range(len(b_model.bone_assign[i])):
-                    # If it's a sim skeleton, use boneparent table
-                    # Otherwise use bone names
-                    if len(armature.data.bones) == 65:
-                        grpname = BoneData.bone_parent_table[ b_model.bone_assign[i][j] ][0]
-                    else:
-                        # print(b_model.bone_assign[i][j])
-                        grpname = armature.data.bones[ b_model.bone_assign[i][j] ].name
-
-                    vertgroup = object.vertex_groups[grpname]
-                    if j != 3:
-                        weight = b_model.bone_weight[i][j]
-                        remainder -= weight
-                        vertgroup.add( [i], weight, 'ADD' )
-                    else:
-                        vertgroup.add( [i], remainder, 'ADD' )
+            if bone_names is None:
+                bone_names = self.bone_names(armature)
+            # One add() per bone and distinct weight
+            for bone, weight, indices in b_model.weight_groups():
+                indices = welded.source_vertices(indices).tolist()
+                if indices:
+                    object.vertex_groups[ bone_names[bone] ].add( indices, weight, 'ADD' )
 
 
             # Add Armature modifier
@@ -314,21 +411,22 @@ class ImportGMDC(Operator, ImportHelper):
             shpkey = object.shape_key_add(from_mix=False)
             shpkey.name = "Basis"
 
-            try:
-                for morph in b_model.morphs:
-                    if morph.name == ', ':
-                    	continue
+            base = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+            mesh.vertices.foreach_get("co", base)
 
-                    shpkey = object.shape_key_add(from_mix=False)
-                    shpkey.name = morph.name
-                
-                    for i, vert in enumerate(mesh.vertices):
-                    	shpkey.data[vert.index].co = Vector( (
-                        	vert.co[0] + morph.deltas[i][0],
-                        	vert.co[1] + morph.deltas[i][1],
-                        	vert.co[2] + morph.deltas[i][2]
-                        	) )
-            except: print("Additional morphs were discarded.")
+            for morph in b_model.morphs:
+                if morph.name == ', ':
+                    continue
+
+                error = self.morph_error(morph, len(b_model.vertices))
+                if error:
+                    print('ERROR: Morph \'' + morph.name + '\' discarded, ' + error)
+                    continue
+
+                deltas = np.asarray(morph.deltas, dtype=np.float32)[welded.vertex_sources]
+                shpkey = object.shape_key_add(from_mix=False)
+                shpkey.name = morph.name
+                shpkey.data.foreach_set("co", base + deltas.reshape(-1))
 
         # Add vertex group to control which verts keep their old normals
         # object.vertex_groups.new("__NORMALS__")
@@ -338,88 +436,87 @@ class ImportGMDC(Operator, ImportHelper):
         #     vertgroup.add( [i], 1, 'ADD' )
 
         # Import Original normals as vertex colors
-        mesh.vertex_colors.new(name = "__NORMALS__")
-        color_map = mesh.vertex_colors['__NORMALS__']
-        for poly in mesh.polygons:
-            for vert_idx, loop_idx in zip(poly.vertices, poly.loop_indices):
-                # Convert Vertex normal to a valid Color
-                normal = Vector(b_model.normals[vert_idx])
-                normal.normalize()
-                rgb = ( normal + Vector((1.0, 1.0, 1.0)) ) * 0.5
-                rgba = rgb.to_4d()
-                # Set Vertex color to new color
-                color_map.data[loop_idx].color = rgba
-        print("Original normals imported as vertex colors on layer '__NORMALS__'")
-        print()
+        if self.normals_mode == 'COLORS':
+            # Per loop, so split normals survive the welding
+            colors = blender_model.BlenderModel.normals_to_colors(b_model.normals)
+            color_map = mesh.vertex_colors.new(name = "__NORMALS__")
+            color_map.data.foreach_set("color", colors[welded.loop_sources].reshape(-1))
+            print("Original normals imported as vertex colors on layer '__NORMALS__'")
+            print()
 
 
-        # After all that, merge doubles and make originally hard edges sharp
-        bm = bmesh.new()
-        bm.from_mesh(mesh)
-
-        edges = self.get_sharp(b_model)
-
-        bmesh.ops.remove_doubles(bm, verts=bm.verts, dist=0.001)
-
-        # Check mesh edges against edge dictionary, mark hard edges sharp after removing doubles
-        numedges = 0
-        for e in bm.edges:
-            edgemid = tuple((e.verts[0].co + e.verts[1].co) / 2)
-            if edgemid in edges and len(edges[edgemid]) > 2 :
-                    numedges += 1
-                    e.smooth = False
+        # After all that, make originally hard edges sharp
+        print('Checking hard edges...')
+        hard_edges = topology.HardEdges.from_mesh(
+            b_model.vertices, b_model.normals, b_model.faces,
+            position_ids=welded.position_ids
+        )
+        edge_vertices = np.empty(len(mesh.edges) * 2, dtype=np.int32)
+        mesh.edges.foreach_get("vertices", edge_vertices)
+        sharp = hard_edges.mask( welded.vertex_sources[edge_vertices] )
+        mesh.edges.foreach_set("use_edge_sharp", sharp.tolist())
 
-        print(numedges, 'Hard edges found.')
+        print(len(hard_edges), 'Hard edges found.')
         print()
 
-        bm.to_mesh(mesh)
-        bm.free()
+        mesh.polygons.foreach_set("use_smooth", [True] * len(mesh.polygons))
+        mesh.update()
 
-        object.select_set(state=True)
-        bpy.ops.object.shade_smooth()
+        # Import Original normals as custom split normals, needs the smooth
+        # faces and sharp edges set up above
+        if self.normals_mode == 'CUSTOM':
+            normals = np.asarray(b_model.normals, dtype=np.float32)[welded.loop_sources]
+            mesh.normals_split_custom_set(normals)
+            print("Original normals imported as custom split normals")
+            print()
 
 
-        # Delete loose geometry in case of Maxis object imports
-        bpy.ops.object.mode_set(mode='EDIT')
-        bpy.ops.mesh.select_all(action='SELECT')
-        bpy.ops.mesh.delete_loose()
-        bpy.ops.object.mode_set(mode='OBJECT')
+        return 'Group \'' + b_model.name + '\' imported.\n'
 
 
-        return 'Group \'' + b_model.name + '\' imported.\n'
+    @staticmethod
+    def load_geometry(mesh, b_model, welded):
+        """
+        Fill an empty mesh with the welded geometry of a BlenderModel,
+        using bulk foreach_set calls
+        """
+        # Every face is a triangle, loop i belongs to face i // 3
+        loop_vertices = np.ascontiguousarray(welded.faces, dtype=np.int32).reshape(-1)
+        face_count = len(welded.faces)
 
+        mesh.vertices.add( len(welded.vertices) )
+        mesh.vertices.foreach_set(
+            "co", np.ascontiguousarray(welded.vertices, dtype=np.float32).reshape(-1)
+        )
 
-    def get_sharp(self, b_model):
-        print('Checking hard edges...')
+        mesh.loops.add( len(loop_vertices) )
+        mesh.loops.foreach_set("vertex_index", loop_vertices)
 
-        edges = {}
-
-        # Build edges from faces in b_model and check if their normals differ
-        for f in b_model.faces:
-            for i, vertidx in enumerate(f):
-                idx_tocheck = i + 1
-                if i == len(f) - 1:
-                    idx_tocheck = 0
-                e = tuple(
-                    ( Vector( b_model.vertices[f[i]] ) + Vector( b_model.vertices[f[idx_tocheck]] ) ) / 2
-                )
-                if e not in edges:
-                    edges[e] = [ b_model.normals[f[i]], b_model.normals[f[idx_tocheck]] ]
-                    continue
-                if b_model.normals[f[i]] not in edges[e]:
-                    edges[e].append(b_model.normals[f[i]])
-                if b_model.normals[f[idx_tocheck]] not in edges[e]:
-                    edges[e].append(b_model.normals[f[idx_tocheck]])
+        mesh.polygons.add(face_count)
+        mesh.polygons.foreach_set(
+            "loop_start", np.arange(0, face_count * 3, 3, dtype=np.int32)
+        )
+        mesh.polygons.foreach_set(
+            "loop_total", np.full(face_count, 3, dtype=np.int32)
+        )
+
+        mesh.update(calc_edges=True)
 
-        return edges
+        # Normals
+        normals = np.asarray(b_model.normals, dtype=np.float32)[welded.vertex_sources]
+        mesh.vertices.foreach_set("normal", normals.reshape(-1))
 
+        # Create UV layer, every loop takes the UV of its source vertex
+        uvs = np.asarray(b_model.uvs, dtype=np.float32)[welded.loop_sources]
+        uv_layer = mesh.uv_layers.new(name = 'UVMap')
+        uv_layer.data.foreach_set("uv", uvs.reshape(-1))
 
 
     # DEBUG
     def debug_boundmesh(self, subsets, skeldata):
         vert_offset = 0
         for set, bone in zip(subsets, skeldata):
-            if not set.faces:
+            if len(set.vertices) == 0:
                 continue
 
             # Negate trans to account for flipped axes
@@ -456,12 +553,149 @@ class ImportGMDC(Operator, ImportHelper):
         print()
         print()
 
-        for vco, vno in zip(model.vertices, model.normals):
-            if vco in neckfixes.test:
-                print(vco, ":\n    ", vno, ",", sep="")
+        for vco, vno in zip(model.vertices.tolist(), model.normals.tolist()):
+            # The lookup table is keyed by coordinate tuples
+            vco = tuple(vco)
+            if vco in neckfixes.neck_normals[0]:
+                print(vco, ":\n    ", tuple(vno), ",", sep="")
                 print(neckfixes.neck_normals[0][vco])
 
         print()
         print()
         print()
         print( "######## NECK NORMALS ########" )
+
+
+
+class ImportGMDCBatch(ImportGMDC, ImportHelper):
+    """Import several Sims 2 GMDC files at once, sharing their skeletons"""
+    bl_idname = "import.gmdc_batch_import"
+    bl_label = "Sims 2 GMDC batch (.5gd)"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    # ImportHelper mixin class uses this
+    filename_ext = ".5gd"
+
+    filter_glob = ImportGMDC.filter_glob
+
+    files = CollectionProperty(
+            type=OperatorFileListElement,
+            options={'HIDDEN', 'SKIP_SAVE'},
+            )
+
+    directory = StringProperty(
+            subtype='DIR_PATH',
+            options={'HIDDEN', 'SKIP_SAVE'},
+            )
+
+    do_folder = BoolProperty(
+            name="Whole folder",
+            description="Import every .5gd file in the folder and its subfolders, instead of the selected files",
+            default=False,
+            )
+
+    workers = IntProperty(
+            name="Parsing threads",
+            description="Number of files parsed at the same time",
+            default=4,
+            min=1,
+            max=32,
+            )
+
+    # Blender only registers properties declared on the class itself,
+    # these are the ones the methods shared with ImportGMDC read
+    do_skeleton     = ImportGMDC.do_skeleton
+    do_shadows      = ImportGMDC.do_shadows
+    group_names     = ImportGMDC.group_names
+    normals_mode    = ImportGMDC.normals_mode
+    cache_directory = ImportGMDC.cache_directory
+    cache_size      = ImportGMDC.cache_size
+
+
+    def execute(self, context):
+        paths = self.file_paths()
+        if not paths:
+            print('No .5gd files selected')
+            return {'CANCELLED'}
+
+        # Parsing doesn't touch any Blender data, so files are parsed
+        # side by side and the objects are created afterwards
+        parse = partial(self.parse_file, group_filter=self.selected_groups(),
+                        cache=self.model_cache())
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            parsed = [pool.submit(parse, path) for path in paths]
+
+        # Armature and its bone names per skeleton key
+        armatures = {}
+        imported = 0
+        for i, path in enumerate(paths):
+            # A file that fails to parse is reported and skipped, the
+            # others are still imported
+            try:
+                gmdc_data, b_models = parsed[i].result()
+            except Exception as error:
+                self.report({'WARNING'}, 'Skipped ' + path + ': '
+                            + type(error).__name__ + ': ' + str(error))
+                continue
+            finally:
+                parsed[i] = None
+
+            print('Importing file:', path)
+            container = self.new_container(context, gmdc_data.header.file_name)
+
+            armature    = None
+            bone_names  = None
+            if self.do_skeleton and gmdc_data.model.transforms:
+                key = BoneData.skeleton_key(gmdc_data)
+                if key not in armatures:
+                    armature = self.import_skeleton(gmdc_data)
+                    armature.parent = container
+                    armatures[key] = ( armature, self.bone_names(armature) )
+                armature, bone_names = armatures[key]
+
+            for model in b_models:
+                print( self.do_import(model, armature, container, bone_names) )
+            imported += 1
+
+        bpy.ops.object.select_all(action='DESELECT')
+        print(imported, 'of', len(paths), 'files imported,', len(armatures), 'armatures created')
+
+        if imported == 0:
+            return {'CANCELLED'}
+        return {'FINISHED'}
+
+
+    def file_paths(self):
+        if not self.do_folder:
+            return [os.path.join(self.directory, file.name) for file in self.files
+                        if file.name.lower().endswith('.5gd')]
+
+        paths = []
+        for dirpath, dirnames, filenames in os.walk(self.directory):
+            dirnames.sort()
+            for name in sorted(filenames):
+                if name.lower().endswith('.5gd'):
+                    paths.append( os.path.join(dirpath, name) )
+        return paths
+
+
+    @staticmethod
+    def parse_file(path, group_filter=None, cache=None):
+        """(GMDC, its BlenderModels) for a file, raises ValueError if it isn't supported"""
+        gmdc_data = GMDC.from_file_data(path, cache=cache)
+        if gmdc_data.load_header() == False:
+            raise ValueError(gmdc_data.unsupported_reason())
+
+        gmdc_data.load_data()
+        b_models = list( blender_model.BlenderModel.groups_from_gmdc(gmdc_data, group_filter) )
+        return gmdc_data, b_models
+
+
+    @staticmethod
+    def new_container(context, filename):
+        """Same empty the single file import adds, without an operator call"""
+        container = bpy.data.objects.new(filename.split("-")[0], None)
+        container.empty_display_type = 'PLAIN_AXES'
+        container["filename"] = filename
+        context.collection.objects.link(container)
+        return container
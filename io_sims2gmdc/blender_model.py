@@ -16,116 +16,123 @@ Created by SmugTomato
     You should have received a copy of the GNU General Public License
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 '''
+import numpy as np
+
 from .element_id    import ElementID
 from .morphmap      import MorphMap
 
 class BlenderModel:
 
+    __slots__ = ('name', 'vertices', 'normals', 'tangents', 'faces', 'uvs', 'bone_assign',
+                    'bone_weight', 'opacity_amount', 'morphs', 'morph_bytemap')
+
+    # Sims 2 has the X and Y axis reversed
+    AXIS_FLIP   = np.array((-1.0, -1.0, 1.0), dtype=np.float32)
+    # Unused bone assignment slots hold 255
+    NO_BONE     = 255
+
     def __init__(self, vertices, normals, tangents, faces, uvs, name,
                     bone_assign, bone_weight, opacity_amount, morphs,
                     morph_bytemap):
+        # Rows are per vertex, arrays on import and export alike except
+        # where noted
         self.name           = name
-        self.vertices       = vertices
-        self.normals        = normals
-        self.tangents       = tangents
-        self.faces          = faces
-        self.uvs            = uvs
-        self.bone_assign    = bone_assign
-        self.bone_weight    = bone_weight
-        self.opacity_amount = opacity_amount
-        self.morphs         = morphs
-        self.morph_bytemap  = morph_bytemap
+        self.vertices       = vertices          # (n, 3) float32
+        self.normals        = normals           # (n, 3) float32
+        self.tangents       = tangents          # (n, 3) float32, None or empty without
+        self.faces          = faces             # (faces, 3) vertex indices
+        self.uvs            = uvs               # (n, 2) float32
+        self.bone_assign    = bone_assign       # (n, 4) bone indices, -1 unused on import,
+                                                # lists with NO_BONE unused on export
+        self.bone_weight    = bone_weight       # (n, 3) weights, the 4th is implied
+        self.opacity_amount = opacity_amount    # int
+        self.morphs         = morphs            # List of MorphMap
+        self.morph_bytemap  = morph_bytemap     # (n, 4) morph numbers, export only
 
     @staticmethod
-    def groups_from_gmdc(gmdc_data):
-        groups = []
-        for g in gmdc_data.groups:
-            # Load single group from a linkage
-
-            # Get all linked elements
-            element_indices = []
-            for i in gmdc_data.linkages[g.link_index].indices:
-                element_indices.append(i)
-            groups.append(element_indices)
+    def groups_from_gmdc(gmdc_data, group_filter=None):
+        """
+        Yield a BlenderModel per group, one at a time. Groups for which
+        group_filter(group) is false are skipped without reading their
+        elements. With lazily loaded elements, those of a group are
+        released again once the next model is asked for.
+        Models are taken from and added to gmdc_data.cache, if it has one.
+        """
+        cache = gmdc_data.cache
+        for i, group in enumerate(gmdc_data.groups):
+            if group_filter is not None and not group_filter(group):
+                continue
+
+            model = None
+            if cache is not None:
+                model = cache.load(gmdc_data.cache_key, i)
+            if model is None:
+                model = BlenderModel.from_gmdc(gmdc_data, i)
+                if cache is not None:
+                    cache.store(gmdc_data.cache_key, i, model)
+
+            yield model
+            gmdc_data.release_group(i)
 
-        models = []
-        for i, element_indices in enumerate(groups):
-            tmp_model = BlenderModel.from_gmdc(gmdc_data, element_indices, i)
-            models.append(tmp_model)
 
-        return models
+    @staticmethod
+    def group_filter(names=None, shadows=True):
+        """
+        Filter for groups_from_gmdc, keeps the groups named in names
+        (all when empty) and leaves out shadow groups unless shadows is set
+        """
+        names = set(names or ())
+
+        def wanted(group):
+            if not shadows and 'shadow' in group.name:
+                return False
+            return not names or group.name in names
+        return wanted
 
     # Build the necessary data for blender from the gmdc data
+    # All per vertex data ends up in NumPy arrays, one row per vertex
     @staticmethod
-    def from_gmdc(gmdc_data, element_indices, group_index):
-        # Get all linked elements
-        # elements = []
-        # for link in gmdc_data.linkages:
-        #     for ref in link.indices:
-        #         elements.append(gmdc_data.elements[ref])
-        # print(elements)
+    def from_gmdc(gmdc_data, group_index):
+        link_index  = gmdc_data.groups[group_index].link_index
 
         vertices    = None
         uvs         = None
         normals     = None
-        bone_assign = []
-        bone_weight = []
-        morphs      = []
-        for ind in element_indices:
-            # Vertices
-            if gmdc_data.elements[ind].element_identity == ElementID.VERTICES:
-                vertices = []
-                for v in gmdc_data.elements[ind].element_values:
-                    # Flip X and Y axis, Sims 2 has these reversed
-                    values = (-v[0], -v[1], v[2])
-                    vertices.append(values)
-
-            # UV coordinates
-            if gmdc_data.elements[ind].element_identity == ElementID.UV_COORDINATES:
-                uvs = []
-                for v in gmdc_data.elements[ind].element_values:
-                    # Flip v value and add 1 to make it work in blender
-                    uv_set = (v[0], -v[1] + 1)
-                    uvs.append(uv_set)
-
-            # Normals
-            if gmdc_data.elements[ind].element_identity == ElementID.NORMALS_LIST:
-                normals = []
-                for v in gmdc_data.elements[ind].element_values:
-                    # Flip X and Y axis, Sims 2 has these reversed
-                    normal_set = (-v[0], -v[1], v[2])
-                    normals.append(normal_set)
-
-            # Bone Assignments
-            if gmdc_data.elements[ind].element_identity == ElementID.BONE_ASSIGNMENTS:
-                bone_assign = []
-                testarr = []
-                for v in gmdc_data.elements[ind].element_values:
-                    temp_array = []
-                    for num in v:
-                        if num != 255:
-                            # The true index of the bone, as stored in the group's
-                            # Subset section.
-                            truenum = gmdc_data.groups[group_index].subsets[num]
-                            temp_array.append(truenum)
-                    bone_assign.append(temp_array)
-
-            # Bone Weights
-            if gmdc_data.elements[ind].element_identity == ElementID.BONE_WEIGHTS:
-                bone_weight = gmdc_data.elements[ind].element_values
-
-
-
-        # Faces
-        faces = []
-        face_count = int(len(gmdc_data.groups[group_index].faces) / 3)
-        for i in range(0,face_count):
-            face = (
-                gmdc_data.groups[group_index].faces[i*3 + 0],
-                gmdc_data.groups[group_index].faces[i*3 + 1],
-                gmdc_data.groups[group_index].faces[i*3 + 2]
+        bone_assign = np.empty((0, 4), dtype=np.int16)
+        bone_weight = np.empty((0, 3), dtype=np.float32)
+
+        # Vertices
+        element = gmdc_data.linked_element(link_index, ElementID.VERTICES)
+        if element is not None:
+            vertices = element.element_values * BlenderModel.AXIS_FLIP
+
+        # UV coordinates
+        element = gmdc_data.linked_element(link_index, ElementID.UV_COORDINATES)
+        if element is not None:
+            # Flip v value and add 1 to make it work in blender
+            uvs = np.array(element.element_values)
+            uvs[:,1] = 1 - uvs[:,1]
+
+        # Normals
+        element = gmdc_data.linked_element(link_index, ElementID.NORMALS_LIST)
+        if element is not None:
+            normals = element.element_values * BlenderModel.AXIS_FLIP
+
+        # Bone Assignments
+        element = gmdc_data.linked_element(link_index, ElementID.BONE_ASSIGNMENTS)
+        if element is not None:
+            bone_assign = BlenderModel.__bone_indices(
+                element.element_values, gmdc_data.groups[group_index].subsets
             )
-            faces.append(face)
+
+        # Bone Weights
+        element = gmdc_data.linked_element(link_index, ElementID.BONE_WEIGHTS)
+        if element is not None:
+            bone_weight = element.element_values
+
+
+        # Faces, a view on the group's face list
+        faces = gmdc_data.groups[group_index].faces.reshape(-1, 3)
 
 
         # Name and opacity
@@ -134,9 +141,75 @@ class BlenderModel:
 
 
         # Morphs
-        morphs = MorphMap.make_morphs(gmdc_data, group_index, element_indices)
+        morphs = MorphMap.make_morphs(gmdc_data, link_index)
 
 
         return BlenderModel(vertices, normals, None, faces, uvs, name,
                             bone_assign, bone_weight, opacity_amount,
                             morphs, None)
+
+
+    @staticmethod
+    def normals_to_colors(normals):
+        """
+        RGBA colours for a (n, 3) array of normals, as stored on the
+        '__NORMALS__' vertex colour layer: normalized, mapped to 0..1
+        """
+        normals = np.asarray(normals, dtype=np.float32).reshape(-1, 3)
+        lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+        # Zero length normals stay zero, like Vector.normalize()
+        lengths[lengths == 0] = 1
+
+        colors = np.ones( (len(normals), 4), dtype=np.float32 )
+        colors[:, :3] = (normals / lengths + 1) * 0.5
+        return colors
+
+
+    def weight_groups(self):
+        """
+        Yield (bone index, weight, vertex indices) for every distinct weight
+        of every assigned bone. Unused slots are skipped, the weight of a
+        4th bone is implied as 1 minus the weights before it.
+        """
+        assign = np.asarray(self.bone_assign)
+        used = assign >= 0
+
+        # Stored weights, with a column for the implied 4th weight
+        weights = np.zeros(assign.shape, dtype=np.float64)
+        stored = np.asarray(self.bone_weight, dtype=np.float64)[:, :3]
+        weights[:, :stored.shape[1]] = stored
+        weights *= used
+        if assign.shape[1] > 3:
+            weights[:, 3] = 1.0 - weights[:, :3].sum(axis=1)
+
+        vertices = np.nonzero(used)[0]
+        bones = assign[used]
+        weights = weights[used]
+        if len(bones) == 0:
+            return
+
+        # Sort by bone then weight, every run of equal pairs is one group
+        order = np.lexsort( (weights, bones) )
+        bones = bones[order]
+        weights = weights[order]
+        vertices = vertices[order]
+        starts = np.nonzero(
+            (bones[1:] != bones[:-1]) | (weights[1:] != weights[:-1])
+        )[0] + 1
+        starts = np.concatenate( ([0], starts) )
+        ends = np.concatenate( (starts[1:], [len(bones)]) )
+
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            yield int(bones[start]), float(weights[start]), vertices[start:end].tolist()
+
+
+    @staticmethod
+    def __bone_indices(assignments, subsets):
+        """
+        Map the per group bone numbers to the true bone indices stored in
+        the group's subset section, unused slots become -1
+        """
+        lookup = np.full(256, -1, dtype=np.int16)
+        count = min(len(subsets), BlenderModel.NO_BONE)
+        lookup[:count] = subsets[:count]
+        return lookup[assignments]
@@ -16,6 +16,9 @@ Created by SmugTomato
     You should have received a copy of the GNU General Public License
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 '''
+import hashlib
+
+import numpy as np
 
 
 class BoneData:
@@ -100,12 +103,14 @@ class BoneData:
     ]
 
 
+    __slots__ = ('name', 'parent', 'subset', 'position', 'rotation')
+
     def __init__(self, name, parent, subset, position, rotation):
-        self.name       = name
-        self.parent     = parent
-        self.subset     = subset
-        self.position   = position      # Translate  XYZ
-        self.rotation   = rotation      # Quaternion WXYZ
+        self.name       = name          # str
+        self.parent     = parent        # str, name of the parent bone, None for a root bone
+        self.subset     = subset        # int, index of the bone's transform and subset
+        self.position   = position      # (x, y, z) floats, translate
+        self.rotation   = rotation      # (w, x, y, z) floats, quaternion
 
 
     @staticmethod
@@ -135,6 +140,16 @@ class BoneData:
         return bones
 
 
+    @staticmethod
+    def skeleton_key(gmdc):
+        """
+        Digest of the bone transforms of a GMDC, the ones with
+        equal keys get the same skeleton from build_bones
+        """
+        transforms = np.asarray(gmdc.model.transforms, dtype='<f4')
+        return hashlib.sha1( transforms.tobytes() ).hexdigest()
+
+
     @staticmethod
     def from_armature(armature):
         bones = [None] * len(armature.data.bones)
@@ -0,0 +1,157 @@
+'''
+Copyright (C) 2018 SmugTomato
+
+Created by SmugTomato
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+
+from .blender_model import BlenderModel
+from .morphmap import MorphMap
+
+
+class ModelCache:
+    """
+    Directory of BlenderModels built by BlenderModel.from_gmdc, one .npz
+    file per group of a GMDC. Entries are keyed by the content of the
+    file they came from and evicted least recently used first once the
+    directory holds more than max_bytes.
+    """
+
+    # Bump when from_gmdc starts building different models,
+    # entries written by an older version are never read again
+    PARSER_VERSION  = 1
+    SUFFIX          = '.gmdc.npz'
+
+    # Arrays of a BlenderModel stored as they are, None ones are left out
+    ARRAYS = ('vertices', 'normals', 'uvs', 'faces', 'bone_assign', 'bone_weight')
+
+    __slots__ = ('directory', 'max_bytes')
+
+    def __init__(self, directory, max_bytes=512 * 1024 * 1024):
+        self.directory  = directory     # str
+        self.max_bytes  = max_bytes     # int, size evict trims the cache to
+        os.makedirs(directory, exist_ok=True)
+
+
+    @staticmethod
+    def file_key(file_data):
+        digest = hashlib.sha1(file_data).hexdigest()
+        return digest + '-v' + str(ModelCache.PARSER_VERSION)
+
+
+    def __path(self, key, group_index):
+        return os.path.join(self.directory, key + '-' + str(group_index) + ModelCache.SUFFIX)
+
+
+    def load(self, key, group_index):
+        """
+        Cached model of a group, or None. Entries that can't be read are
+        removed and count as a miss, the cache never fails an import.
+        """
+        path = self.__path(key, group_index)
+        if not os.path.exists(path):
+            return None
+
+        try:
+            model = ModelCache.__read(path)
+            # Last use is the modification time, see evict
+            os.utime(path)
+        except Exception as error:
+            # Truncated, corrupt or missing arrays: EOFError, BadZipFile,
+            # KeyError and others
+            print('Removing unreadable model cache entry', path + ':', error)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+
+        return model
+
+
+    @staticmethod
+    def __read(path):
+        with np.load(path, allow_pickle=False) as data:
+            arrays = {name: data[name] for name in data.files}
+
+        morphs = []
+        for i, name in enumerate(arrays['morph_names'].tolist()):
+            morphs.append( MorphMap(name, arrays.get('morph' + str(i)), None) )
+
+        return BlenderModel(
+            arrays.get('vertices'), arrays.get('normals'), None,
+            arrays['faces'], arrays.get('uvs'), str(arrays['name']),
+            arrays['bone_assign'], arrays['bone_weight'],
+            int(arrays['opacity_amount']), morphs, None
+        )
+
+
+    def store(self, key, group_index, model):
+        arrays = {}
+        for name in ModelCache.ARRAYS:
+            if getattr(model, name) is not None:
+                arrays[name] = getattr(model, name)
+
+        arrays['name']              = np.array(model.name)
+        arrays['opacity_amount']    = np.array(model.opacity_amount)
+        arrays['morph_names']       = np.array([morph.name for morph in model.morphs], dtype=str)
+        for i, morph in enumerate(model.morphs):
+            if morph.deltas is not None:
+                arrays['morph' + str(i)] = morph.deltas
+
+        # Written next to the entry first, so readers never see half of it
+        handle, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as file:
+                np.savez(file, **arrays)
+            os.replace(temp_path, self.__path(key, group_index))
+        except OSError as error:
+            print('Could not write to the model cache:', error)
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return
+
+        self.evict()
+
+
+    def evict(self):
+        """Remove the least recently used entries until max_bytes is kept"""
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(ModelCache.SUFFIX):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append( (stat.st_mtime, stat.st_size, entry.path) )
+            total += stat.st_size
+
+        entries.sort()
+        for mtime, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                # Already removed by another import
+                pass
+            total -= size
@@ -16,22 +16,27 @@ Created by SmugTomato
     You should have received a copy of the GNU General Public License
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 '''
+import numpy as np
+
 from .element_id import ElementID
-from mathutils import Vector
 
 
 class MorphMap:
 
+    __slots__ = ('name', 'deltas', 'ndeltas')
+
+    # Sims 2 has the X and Y axis reversed
+    AXIS_FLIP = np.array((-1.0, -1.0, 1.0), dtype=np.float32)
 
 
     def __init__(self, name, deltas, ndeltas):
-        self.name = name
-        self.deltas = deltas
-        self.ndeltas = ndeltas
+        self.name = name            # str, "name, name" pair
+        self.deltas = deltas        # (n, 3) position deltas, None if not linked
+        self.ndeltas = ndeltas      # (n, 3) normal deltas, export only
 
 
     @staticmethod
-    def make_morphs(gmdc_data, group_index, element_indices):
+    def make_morphs(gmdc_data, link_index):
         morphs = []
         namepairs = gmdc_data.model.name_pairs
         iter = 0
@@ -44,12 +49,11 @@ class MorphMap:
                 morphs.append( MorphMap(name, None, None) )
                 continue
 
-            for ind in element_indices:
-                if gmdc_data.elements[ind].element_identity == \
-                    ElementID.MORPH_VERTEX_DELTAS and \
-                    gmdc_data.elements[ind].identity_repitition == iter:
-                        deltas = MorphMap.__read_deltas( gmdc_data.elements[ind] )
-                        break
+            element = gmdc_data.linked_element(
+                link_index, ElementID.MORPH_VERTEX_DELTAS, iter
+            )
+            if element is not None:
+                deltas = MorphMap.__read_deltas(element)
 
             iter += 1
 
@@ -58,11 +62,8 @@ class MorphMap:
 
     @staticmethod
     def __read_deltas( element ):
-        deltas = []
-        for line in element.element_values:
-            # Flip X and Y just like the verices
-            deltas.append( (-line[0], -line[1], line[2]) )
-        return deltas
+        # Flip X and Y just like the vertices
+        return element.element_values * MorphMap.AXIS_FLIP
 
 
     @staticmethod
@@ -24,9 +24,11 @@ class BoundMesh:
     """Create a bounding mesh for a static object"""
 
 
+    __slots__ = ('vertices', 'faces')
+
     def __init__(self, vertices, faces):
-        self.vertices = vertices
-        self.faces    = faces
+        self.vertices = vertices    # List of (x, y, z) tuples
+        self.faces    = faces       # List of 3 vertex index tuples
 
 
     @staticmethod
@@ -18,45 +18,78 @@ Created by SmugTomato
 '''
 import struct
 
+import numpy as np
+
 
 class DataReader:
 
+    INT16   = struct.Struct('<h')
+    INT32   = struct.Struct('<i')
+    UINT32  = struct.Struct('<I')
+    FLOAT   = struct.Struct('<f')
+
+    INT16_ARRAY     = np.dtype('<i2')
+    UINT16_ARRAY    = np.dtype('<u2')
+
     def __init__(self, file_data, byte_offset):
-        self.file_data = file_data
+        # A memoryview lets us slice the file buffer without copying it
+        self.file_data = memoryview(file_data) if file_data is not None else None
         self.byte_offset = byte_offset
 
+    def __unpack(self, fmt):
+        val = fmt.unpack_from(self.file_data, self.byte_offset)[0]
+        self.byte_offset += fmt.size
+        return val
+
+    def tell(self):
+        return self.byte_offset
+
+    def skip(self, count):
+        self.byte_offset += count
+
     def read_byte(self):
         byte = self.file_data[self.byte_offset]
         self.byte_offset += 1
         return byte
 
+    def read_bytes(self, count):
+        """Return the next count bytes as a zero-copy memoryview slice"""
+        end = self.byte_offset + count
+        if end > len(self.file_data):
+            raise struct.error('unpack requires a buffer of ' + str(count) + ' bytes')
+        bytes = self.file_data[self.byte_offset:end]
+        self.byte_offset = end
+        return bytes
+
     def read_byte_string(self):
         str_len = self.read_byte()
-        bytes = bytearray()
-        for i in range(0,str_len):
-            bytes.append(self.read_byte())
-        return bytes.decode("utf-8")
+        return str(self.read_bytes(str_len), "utf-8")
 
     def read_int16(self):
-        bytes = bytearray()
-        for i in range(0,2):
-            bytes.append(self.read_byte())
-        return struct.unpack('<h', bytes)[0]
+        return self.__unpack(DataReader.INT16)
 
     def read_int32(self):
-        bytes = bytearray()
-        for i in range(0,4):
-            bytes.append(self.read_byte())
-        return struct.unpack('<i', bytes)[0]
+        return self.__unpack(DataReader.INT32)
 
     def read_uint32(self):
-        bytes = bytearray()
-        for i in range(0,4):
-            bytes.append(self.read_byte())
-        return struct.unpack('<I', bytes)[0]
+        return self.__unpack(DataReader.UINT32)
 
     def read_float(self):
-        bytes = bytearray()
-        for i in range(0,4):
-            bytes.append(self.read_byte())
-        return struct.unpack('<f', bytes)[0]
+        return self.__unpack(DataReader.FLOAT)
+
+    def __read_array(self, dtype, count):
+        # Read-only view of the file buffer, no copy is made
+        values = np.frombuffer(self.file_data, dtype, count, self.byte_offset)
+        self.byte_offset += count * dtype.itemsize
+        return values
+
+    def read_int16_array(self, count):
+        return self.__read_array(DataReader.INT16_ARRAY, count)
+
+    def read_uint16_array(self, count):
+        return self.__read_array(DataReader.UINT16_ARRAY, count)
+
+    def read_float_array(self, count):
+        values = struct.unpack_from('<' + str(count) + 'f', self.file_data, self.byte_offset)
+        self.byte_offset += count * 4
+        return list(values)
@@ -18,40 +18,122 @@ Created by SmugTomato
 '''
 import struct
 
+import numpy as np
+
 
 class DataWriter:
 
+    BYTE    = struct.Struct('B')
+    INT16   = struct.Struct('<H')
+    INT32   = struct.Struct('<i')
+    UINT32  = struct.Struct('<I')
+    FLOAT   = struct.Struct('<f')
+
+    CHUNK_SIZE = 1 << 20
+
+    # 16 bit fields hold signed or unsigned values, anything else is an error
+    INT16_MIN   = -0x8000
+    INT16_MAX   = 0xFFFF
+
 
-    def __init__(self):
-        self.data_array = []
+    def __init__(self, file_data=None, chunk_size=CHUNK_SIZE):
+        # When a file is given, the buffer is flushed to it every time it
+        # fills up, so no more than about one chunk is ever kept in memory
+        self.file_data      = file_data
+        self.data_array     = bytearray(chunk_size)
+        self.byte_offset    = 0
+        self.written_bytes  = 0     # Bytes that already left the buffer
 
 
     def write_out(self, file_data):
-        for val in self.data_array:
-            file_data.write(val)
+        with memoryview(self.data_array) as view:
+            file_data.write(view[:self.byte_offset])
+        self.written_bytes += self.byte_offset
+        self.byte_offset = 0
+
+
+    def tell(self):
+        """Total number of bytes written so far"""
+        return self.written_bytes + self.byte_offset
+
+
+    def flush(self):
+        if self.file_data is not None and self.byte_offset > 0:
+            self.write_out(self.file_data)
+
+
+    def __reserve(self, size):
+        if self.byte_offset + size > len(self.data_array):
+            self.flush()
+            if self.byte_offset + size > len(self.data_array):
+                grow = max(size, len(self.data_array))
+                self.data_array.extend( bytes(grow) )
+
+        start = self.byte_offset
+        self.byte_offset += size
+        return start
+
+
+    def __pack(self, fmt, num):
+        fmt.pack_into(self.data_array, self.__reserve(fmt.size), num)
 
 
     def write_byte(self, num):
-        val = struct.pack('B', num)
-        self.data_array.append(val)
+        self.__pack(DataWriter.BYTE, num)
+
+    def write_bytes(self, data):
+        with memoryview(data) as view:
+            if view.nbytes == 0:
+                return
+            view = view.cast('B')
+            # Large blocks skip the buffer when streaming to a file
+            if self.file_data is not None and len(view) >= len(self.data_array):
+                self.flush()
+                self.file_data.write(view)
+                self.written_bytes += len(view)
+                return
+
+            start = self.__reserve(len(view))
+            self.data_array[start:self.byte_offset] = view
 
     def write_byte_string(self, str):
-        self.write_byte(len(str))
         b_str = str.encode("utf-8")
-        self.data_array.append(b_str)
+        self.write_byte(len(b_str))
+        self.write_bytes(b_str)
 
     def write_int16(self, num):
-        val = struct.pack('<H', num)
-        self.data_array.append(val)
+        if not DataWriter.INT16_MIN <= num <= DataWriter.INT16_MAX:
+            raise ValueError('Value does not fit in 16 bits: ' + str(num))
+        # Store the 16 bit pattern, signed values read back by DataReader fit too
+        self.__pack(DataWriter.INT16, num & 0xFFFF)
 
     def write_int32(self, num):
-        val = struct.pack('<i', num)
-        self.data_array.append(val)
+        self.__pack(DataWriter.INT32, num)
 
     def write_uint32(self, num):
-        val = struct.pack('<I', num)
-        self.data_array.append(val)
+        self.__pack(DataWriter.UINT32, num)
 
     def write_float(self, num):
-        val = struct.pack('<f', num)
-        self.data_array.append(val)
+        self.__pack(DataWriter.FLOAT, num)
+
+    # The array writers take any (nested) sequence or NumPy array and
+    # serialize all of its values in one go, in row-major order
+
+    def write_byte_array(self, values):
+        self.write_bytes( np.ascontiguousarray(values, dtype='u1') )
+
+    def write_int16_array(self, values):
+        # Through int64 and the 16 bit pattern, like write_int16
+        values = np.asarray(values)
+        if values.dtype.kind not in 'iu':
+            values = values.astype(np.int64)
+        if values.dtype.itemsize > 2 and values.size:
+            low = values.min()
+            high = values.max()
+            if low < DataWriter.INT16_MIN or high > DataWriter.INT16_MAX:
+                raise ValueError('Value does not fit in 16 bits: '
+                                    + str(low if low < DataWriter.INT16_MIN else high))
+        self.write_bytes( np.ascontiguousarray(values.astype('<u2', copy=False)) )
+
+    def write_float_array(self, values):
+        self.write_bytes( np.ascontiguousarray(values, dtype='<f4') )
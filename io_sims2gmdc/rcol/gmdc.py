@@ -16,10 +16,16 @@ Created by SmugTomato
     You should have received a copy of the GNU General Public License
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 '''
+import contextlib
+import mmap
+
 from .gmdc_data import gmdc_header, gmdc_element, gmdc_linkage, gmdc_group, gmdc_model, gmdc_subset
 from .gmdc_data.gmdc_header import GMDCHeader
 from .data_reader import DataReader
 from .data_writer import DataWriter
+from .lazy_section import LazySection
+from .gmdc_summary import GMDCSummary
+from .metrics import stage
 
 class GMDC:
 
@@ -50,8 +56,10 @@ class GMDC:
     GMDC_IDENTIFIER = 0xAC4F8687
 
 
-    def __init__(self, file_data, byte_offset):
+    def __init__(self, file_data, byte_offset, file_map=None):
         self.data_read  = DataReader(file_data, byte_offset)
+        self.file_map   = file_map
+        self.metrics    = None      # Set to an rcol.metrics.Metrics to record stages
 
         self.header     = None
         self.elements   = None
@@ -60,130 +68,307 @@ class GMDC:
         self.model      = None
         self.subsets    = None
 
+        self.element_keys       = None      # (identity, repetition) per element
+        self.linkage_indices    = None      # Per linkage, see linked_element
+
+        self.cache      = None      # ModelCache used by BlenderModel.groups_from_gmdc
+        self.cache_key  = None      # Key of this file's entries in the cache
+
 
     @staticmethod
-    def from_file_data(file_path):
+    def from_file_data(file_path, use_mmap=False, metrics=None, cache=None):
+        """
+        With a cache given, the file is hashed so models built from it
+        before can be taken from the cache. See ModelCache.
+        """
         print("reading .5gd file...\n")
 
-        file = open(file_path, "rb")
-        file_data = file.read()
-        byte_offset = 0
-        file.close()
-        return GMDC(file_data, byte_offset)
+        with stage(metrics, 'read_file') as record:
+            file = open(file_path, "rb")
+            if use_mmap:
+                # Pages are only read from disk once something touches them
+                file_data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+                file.close()
+                gmdc_data = GMDC(file_data, 0, file_map=file_data)
+            else:
+                file_data = file.read()
+                byte_offset = 0
+                file.close()
+                gmdc_data = GMDC(file_data, byte_offset)
+            record['bytes'] = len(file_data)
+
+        gmdc_data.metrics = metrics
+        if cache is not None:
+            with stage(metrics, 'hash_file'):
+                gmdc_data.cache = cache
+                gmdc_data.cache_key = cache.file_key(file_data)
+        return gmdc_data
+
+
+    @staticmethod
+    def scan(file_path):
+        """
+        Read only the header and section directory of a file.
+        Returns a GMDCSummary, or None if the file is not a version 4 GMDC.
+        """
+        return GMDCSummary.from_file(file_path, GMDC.GMDC_IDENTIFIER)
+
+
+    def close(self):
+        """Release the file mapping of a GMDC loaded with use_mmap"""
+        if self.file_map is None:
+            return
+
+        self.data_read.file_data.release()
+        try:
+            self.file_map.close()
+        except BufferError:
+            # Decoded arrays still point into the mapping,
+            # it gets closed once the last of them is gone
+            pass
+        self.file_map = None
 
 
     def write(self, path):
+        """
+        Blocks read from a file and left unchanged are copied as they are,
+        only new or modified ones get encoded. See RawBlock.
+        """
         print("writing .5gd file...\n")
 
         file_data = open(path, "wb")
-        writer = DataWriter()
+        writer = DataWriter(file_data)
 
-        # HEADER
-        self.header.write(writer)
+        with self.__stage('write', writer.tell):
+            # HEADER
+            with self.__stage('header', writer.tell):
+                self.header.copy_or_write(writer)
 
-        # ELEMENTS
-        writer.write_int32( len(self.elements) )
-        for el in self.elements:
-            el.write(writer)
+            # ELEMENTS
+            with self.__stage('elements', writer.tell, self.elements):
+                self.__write_section(writer, self.elements)
 
-        # LINKAGES
-        writer.write_int32( len(self.linkages) )
-        for li in self.linkages:
-            li.write(writer)
+            # LINKAGES
+            with self.__stage('linkages', writer.tell, self.linkages):
+                self.__write_section(writer, self.linkages)
 
-        # GROUPS
-        writer.write_int32( len(self.groups) )
-        for gr in self.groups:
-            gr.write(writer)
+            # GROUPS
+            with self.__stage('groups', writer.tell, self.groups):
+                self.__write_section(writer, self.groups)
 
-        # MODEL
-        self.model.write(writer)
+            # MODEL
+            with self.__stage('model', writer.tell):
+                self.model.copy_or_write(writer)
 
-        # SUBSETS
-        writer.write_int32( len(self.subsets) )
-        for su in self.subsets:
-            su.write(writer)
+            # SUBSETS
+            with self.__stage('subsets', writer.tell, self.subsets):
+                self.__write_section(writer, self.subsets)
 
-        writer.write_out(file_data)
+            writer.flush()
         file_data.close()
 
 
+    def mark_dirty(self):
+        """
+        Make write encode every block instead of copying its source bytes.
+        Lazy sections get all their blocks decoded.
+        """
+        self.header.mark_dirty()
+        self.model.mark_dirty()
+        for section in (self.elements, self.linkages, self.groups, self.subsets):
+            for block in section:
+                block.mark_dirty()
+
+
+    @staticmethod
+    def __write_section(writer, blocks):
+        writer.write_int32( len(blocks) )
+        if isinstance(blocks, LazySection):
+            blocks.write(writer)
+        else:
+            for block in blocks:
+                block.copy_or_write(writer)
+
+
+    @contextlib.contextmanager
+    def __stage(self, name, tell, blocks=None):
+        """Metrics stage that also records the bytes read or written by it"""
+        start = tell()
+        with stage(self.metrics, name) as record:
+            yield record
+            record['bytes'] = tell() - start
+            if blocks is not None:
+                record['objects'] = len(blocks)
+
+
 
     def load_header(self):
-        self.header = GMDCHeader.from_data(self.data_read)
+        with self.__stage('header', self.data_read.tell):
+            start = self.data_read.byte_offset
+            self.header = GMDCHeader.from_data(self.data_read)
+            self.header.raw = self.__raw_since(start)
 
         if self.header.version != 4 or self.header.file_type != self.GMDC_IDENTIFIER:
             return False
         return True
 
+    def unsupported_reason(self):
+        """Why load_header returned False"""
+        if self.header.file_type != self.GMDC_IDENTIFIER:
+            return 'Not a GMDC, identifier ' + hex(self.header.file_type)
+        return 'Unsupported GMDC version ' + str(self.header.version)
+
     @staticmethod
-    def build_data(filename, b_models, bones, boundmesh, riggedbounds):
+    def build_data(filename, b_models, bones, boundmesh, riggedbounds, metrics=None):
         gmdc_data = GMDC(None, None)
+        gmdc_data.metrics = metrics
+
+        with stage(metrics, 'build_data', objects=len(b_models)):
+            # HEADER
+            gmdc_data.header = GMDCHeader.build_data(filename)
+
+            # ELEMENTS
+            # Tuple ( elements[], group_element_links[][] )
+            with stage(metrics, 'elements') as record:
+                element_data = gmdc_element.GMDCElement.from_blender(b_models, bones)
+                gmdc_data.elements = element_data[0]
+                record['objects'] = len(gmdc_data.elements)
+
+            # LINKAGES
+            with stage(metrics, 'linkages'):
+                gmdc_data.linkages = gmdc_linkage.GMDCLinkage.build_data(
+                    b_models, element_data[1]
+                )
+
+            # GROUPS
+            with stage(metrics, 'groups'):
+                gmdc_data.groups = gmdc_group.GMDCGroup.build_data(
+                    b_models, bones
+                )
+
+            # MODEL
+            with stage(metrics, 'model'):
+                gmdc_data.model = gmdc_model.GMDCModel.build_data(
+                    b_models, bones, boundmesh
+                )
+
+            # SUBSETS
+            with stage(metrics, 'subsets') as record:
+                gmdc_data.subsets = gmdc_subset.GMDCSubset.build_data(
+                    b_models, bones, riggedbounds
+                )
+                record['objects'] = len(gmdc_data.subsets)
 
-        # HEADER
-        gmdc_data.header = GMDCHeader.build_data(filename)
-
-        # ELEMENTS
-        # Tuple ( elements[], group_element_links[][] )
-        element_data = gmdc_element.GMDCElement.from_blender(b_models, bones)
-        gmdc_data.elements = element_data[0]
-
-        # LINKAGES
-        gmdc_data.linkages = gmdc_linkage.GMDCLinkage.build_data(
-            b_models, element_data[1]
-        )
-
-        # GROUPS
-        gmdc_data.groups = gmdc_group.GMDCGroup.build_data(
-            b_models, bones
-        )
+        return gmdc_data
 
-        # MODEL
-        gmdc_data.model = gmdc_model.GMDCModel.build_data(
-            b_models, bones, boundmesh
-        )
 
-        # SUBSETS
-        gmdc_data.subsets = gmdc_subset.GMDCSubset.build_data(
-            b_models, bones, riggedbounds
-        )
+    def load_data(self, lazy=False):
+        """
+        Read all sections of the file. With lazy set, elements, linkages,
+        groups and subsets only have their byte spans recorded and each
+        block is decoded the first time it is accessed.
+        """
+        tell = self.data_read.tell
+        with self.__stage('load_data', tell):
+            with self.__stage('elements', tell) as record:
+                self.load_elements(lazy)
+                record['objects'] = len(self.elements)
+            with self.__stage('linkages', tell) as record:
+                self.load_linkages(lazy)
+                record['objects'] = len(self.linkages)
+            with self.__stage('groups', tell) as record:
+                self.load_groups(lazy)
+                record['objects'] = len(self.groups)
+            with self.__stage('model', tell):
+                self.load_model()
+            with self.__stage('subsets', tell) as record:
+                self.load_subsets(lazy)
+                record['objects'] = len(self.subsets)
+
+
+    def linked_element(self, link_index, identity, repetition=0):
+        """
+        Element of the given identity and repetition linked by a linkage,
+        or None. Each linkage gets a lookup table the first time it is used.
+        """
+        if self.linkage_indices is None:
+            self.linkage_indices = [None] * len(self.linkages)
+
+        index = self.linkage_indices[link_index]
+        if index is None:
+            index = {}
+            for ind in self.linkages[link_index].indices.tolist():
+                index[self.element_keys[ind]] = ind
+            self.linkage_indices[link_index] = index
+
+        ind = index.get( (identity, repetition) )
+        return None if ind is None else self.elements[ind]
+
+
+    def release_group(self, group_index):
+        """
+        Drop the decoded elements of a group, when the elements were
+        loaded with lazy set. Does nothing otherwise.
+        """
+        if not isinstance(self.elements, LazySection):
+            return
+
+        link_index = self.groups[group_index].link_index
+        for ind in self.linkages[link_index].indices.tolist():
+            self.elements.release(ind)
+
+
+    # Single section loaders, these have to be called in file order
+
+    def load_elements(self, lazy=False):
+        self.elements = self.__load_section(gmdc_element.GMDCElement, lazy)
+
+        # Lazy elements are not decoded, skip_data still returns their identity
+        infos = self.elements.skipped if lazy else self.elements
+        self.element_keys = [(el.element_identity, el.identity_repitition) for el in infos]
+        self.linkage_indices = None
+
+    def load_linkages(self, lazy=False):
+        self.linkages = self.__load_section(gmdc_linkage.GMDCLinkage, lazy)
+        self.linkage_indices = None
+
+    def load_groups(self, lazy=False):
+        self.groups = self.__load_section(gmdc_group.GMDCGroup, lazy,
+                                            self.header.version)
+
+    def load_model(self):
+        # Always decoded, it only holds the skeleton, morph names and bounds
+        start = self.data_read.byte_offset
+        self.model = gmdc_model.GMDCModel()
+        self.model.read_data(self.data_read)
+        self.model.raw = self.__raw_since(start)
 
-        return gmdc_data
+    def load_subsets(self, lazy=False):
+        self.subsets = self.__load_section(gmdc_subset.GMDCSubset, lazy)
 
 
-    def load_data(self):
-        # ELEMENTS
+    def __load_section(self, block_type, lazy, *read_args):
         count = self.data_read.read_int32()
-        self.elements = []
-        for i in range(0,count):
-            temp_element = gmdc_element.GMDCElement()
-            temp_element.read_data(self.data_read)
-            self.elements.append(temp_element)
 
-        # LINKAGES
-        count = self.data_read.read_int32()
-        self.linkages = []
-        for i in range(0,count):
-            temp_linkage = gmdc_linkage.GMDCLinkage()
-            temp_linkage.read_data(self.data_read)
-            self.linkages.append(temp_linkage)
-
-        # GROUPS
-        count = self.data_read.read_int32()
-        self.groups = []
+        if not lazy:
+            blocks = []
+            for i in range(0,count):
+                start = self.data_read.byte_offset
+                temp_block = block_type()
+                temp_block.read_data(self.data_read, *read_args)
+                temp_block.raw = self.__raw_since(start)
+                blocks.append(temp_block)
+            return blocks
+
+        spans = []
+        skipped = []
         for i in range(0,count):
-            temp_group = gmdc_group.GMDCGroup()
-            temp_group.read_data(self.data_read, self.header.version)
-            self.groups.append(temp_group)
+            start = self.data_read.byte_offset
+            skipped.append( block_type.skip_data(self.data_read, *read_args) )
+            spans.append( (start, self.data_read.byte_offset) )
+        return LazySection(self.data_read.file_data, spans, block_type, read_args, skipped)
 
-        # MODEL
-        self.model = gmdc_model.GMDCModel()
-        self.model.read_data(self.data_read)
 
-        # SUBSETS
-        count = self.data_read.read_int32()
-        self.subsets = []
-        for i in range(0,count):
-            temp_subset = gmdc_subset.GMDCSubset()
-            temp_subset.read_data(self.data_read)
-            self.subsets.append(temp_subset)
+    def __raw_since(self, start):
+        """Source bytes from start up to the current read position"""
+        return self.data_read.file_data[start:self.data_read.byte_offset]
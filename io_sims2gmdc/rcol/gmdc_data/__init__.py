@@ -1 +1 @@
-__all__ = ["gmdc_element", "gmdc_group", "gmdc_header", "gmdc_linkage", "gmdc_model", "gmdc_subset"]
+__all__ = ["gmdc_element", "gmdc_group", "gmdc_header", "gmdc_linkage", "gmdc_model", "gmdc_subset", "raw_block"]
@@ -16,9 +16,12 @@ Created by SmugTomato
     You should have received a copy of the GNU General Public License
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 '''
+import numpy as np
 
+from .raw_block import RawBlock
 
-class GMDCElement:
+
+class GMDCElement(RawBlock):
 
 
     BLEND_INDICES           = 0x1C4AFC56
@@ -46,21 +49,30 @@ class GMDCElement:
     SET_UV          = 0x02
     SET_SECONDARY   = 0x03
 
+    # Value types per block format, byte blocks hold unsigned 8 bit values
+    FLOAT_TYPE  = np.dtype('<f4')
+    BYTE_TYPE   = np.dtype('u1')
+    REF_TYPE    = np.dtype('<i2')
+
+
+    __slots__ = ('ref_array_size', 'element_identity', 'identity_repitition',
+                    'block_format', 'set_format', 'block_size', 'list_length',
+                    'set_length', 'element_values', 'references')
 
     def __init__(self):
-        self.ref_array_size         = None
-        self.element_identity       = None
-        self.identity_repitition    = None
+        self.ref_array_size         = None  # int
+        self.element_identity       = None  # uint32, one of the identities above
+        self.identity_repitition    = None  # int
 
-        self.block_format   = None
-        self.set_format     = None
+        self.block_format   = None  # int, 0x00 - 0x04
+        self.set_format     = None  # int, one of the SET_ values
 
-        self.block_size     = None
-        self.list_length    = None
-        self.set_length     = None
+        self.block_size     = None  # int, bytes
+        self.list_length    = None  # int, rows of element_values
+        self.set_length     = None  # int, columns of element_values
 
-        self.element_values = None
-        self.references     = None
+        self.element_values = None  # (list_length, set_length) FLOAT_TYPE or BYTE_TYPE array
+        self.references     = None  # REF_TYPE array
 
     def __get_set_length(self):
         if self.block_format == 0x01:
@@ -71,12 +83,17 @@ class GMDCElement:
             return 4
         return 1
 
+    def __get_value_type(self):
+        if self.block_format == 0x04:
+            return GMDCElement.BYTE_TYPE
+        return GMDCElement.FLOAT_TYPE
+
     def __get_list_length(self):
         if self.block_format != 0x04:
             return int(self.block_size / self.set_length / 4)
         return int(self.block_size / 1 / 4)
 
-    def read_data(self, data_read):
+    def __read_info(self, data_read):
         self.ref_array_size         = data_read.read_int32()
         self.element_identity       = data_read.read_uint32()
         self.identity_repitition    = data_read.read_int32()
@@ -89,25 +106,37 @@ class GMDCElement:
         self.set_length     = self.__get_set_length()
         self.list_length    = self.__get_list_length()
 
-        self.element_values = []
-        for i in range(0,self.list_length):
-            temp_array = []
+    def read_data(self, data_read):
+        self.__read_info(data_read)
+
+        # Decode the whole block at once into a (list_length, set_length) array
+        value_type = self.__get_value_type()
+        block = data_read.read_bytes(
+            self.list_length * self.set_length * value_type.itemsize
+        )
+        self.element_values = np.frombuffer(block, dtype=value_type).reshape(
+            self.list_length, self.set_length
+        )
+
+        count = data_read.read_int32()
+        self.references = np.frombuffer(
+            data_read.read_bytes(count * 2), dtype=GMDCElement.REF_TYPE
+        )
 
-            for j in range(0,self.set_length):
-                if self.block_format == 0x04:
-                    temp_val = data_read.read_byte()
-                    temp_array.append(temp_val)
-                else:
-                    temp_val = data_read.read_float()
-                    temp_array.append(temp_val)
 
-            self.element_values.append(temp_array)
+    @staticmethod
+    def skip_data(data_read):
+        """Skip past an element, returning it without values or references"""
+        element = GMDCElement()
+        element.__read_info(data_read)
+        data_read.skip(
+            element.list_length * element.set_length * element.__get_value_type().itemsize
+        )
 
         count = data_read.read_int32()
-        self.references = []
-        for i in range(0,count):
-            temp_val = data_read.read_int16()
-            self.references.append(temp_val)
+        data_read.skip(count * 2)
+
+        return element
 
 
     def print(self):
@@ -125,16 +154,13 @@ class GMDCElement:
         writer.write_int32(self.set_format)
 
         writer.write_int32(self.block_size)
-        for set in self.element_values:
-            for val in set:
-                if self.block_format == 0x04:
-                    writer.write_byte( val )
-                else:
-                    writer.write_float( val )
+        if self.block_format == 0x04:
+            writer.write_byte_array(self.element_values)
+        else:
+            writer.write_float_array(self.element_values)
 
         writer.write_int32(len(self.references))
-        for ref in self.references:
-            writer.write_int16(ref)
+        writer.write_int16_array(self.references)
 
 
     @staticmethod
@@ -146,9 +172,12 @@ class GMDCElement:
         element.block_format = block_format
         element.set_format = set_format
         element.block_size = 0
+        element.set_length = element.__get_set_length()
         element.list_length = 0
-        element.element_values = []
-        element.references = []
+        element.element_values = np.empty(
+            (0, element.set_length), dtype=element.__get_value_type()
+        )
+        element.references = np.empty(0, dtype=GMDCElement.REF_TYPE)
 
         return element
 
@@ -182,9 +211,11 @@ class GMDCElement:
         element.block_format = block_format
         element.set_format = set_format
         element.block_size = block_size
+        element.set_length = _data_len
         element.list_length = ref_array_size
-        element.element_values = data
-        element.references = []
+        element.element_values = np.asarray(data,
+            dtype=element.__get_value_type()).reshape(ref_array_size, _data_len)
+        element.references = np.empty(0, dtype=GMDCElement.REF_TYPE)
 
         return element
 
@@ -287,7 +318,7 @@ class GMDCElement:
                 GMDCElement.from_datalist(
                     mod.uvs, GMDCElement.UV_COORDINATES, 0)
             )
-            if mod.bone_assign:
+            if len(mod.bone_assign) > 0:
                 link_list.append(link_index)
                 link_index += 1
                 # Bone Assignment
@@ -16,17 +16,23 @@ Created by SmugTomato
     You should have received a copy of the GNU General Public License
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 '''
+import numpy as np
 
+from .raw_block import RawBlock
 
-class GMDCGroup:
+
+class GMDCGroup(RawBlock):
+
+    __slots__ = ('primitive_type', 'link_index', 'name', 'faces', 'opacity_amount',
+                    'subsets')
 
     def __init__(self):
-        self.primitive_type = None
-        self.link_index     = None
-        self.name           = None
-        self.faces          = None
-        self.opacity_amount = None
-        self.subsets        = None
+        self.primitive_type = None      # int
+        self.link_index     = None      # int, index into the linkages
+        self.name           = None      # str
+        self.faces          = None      # uint16 array, 3 vertex indices per face
+        self.opacity_amount = None      # int
+        self.subsets        = None      # int16 array, bone subsets used by the group
 
     def read_data(self, data_read, version):
         self.primitive_type = data_read.read_int32()
@@ -34,19 +40,28 @@ class GMDCGroup:
         self.name           = data_read.read_byte_string()
 
         count = data_read.read_int32()
-        self.faces = []
-        for i in range(0,count):
-            vertex_ref = data_read.read_int16()
-            self.faces.append(vertex_ref)
+        self.faces = data_read.read_uint16_array(count)
 
         self.opacity_amount = data_read.read_int32()
 
         if version != 1:
             count = data_read.read_int32()
-            self.subsets = []
-            for i in range(0,count):
-                subset_ref = data_read.read_int16()
-                self.subsets.append(subset_ref)
+            self.subsets = data_read.read_int16_array(count)
+
+
+    @staticmethod
+    def skip_data(data_read, version):
+        data_read.skip(8)       # primitive_type, link_index
+        data_read.skip(data_read.read_byte())
+
+        count = data_read.read_int32()
+        data_read.skip(count * 2)
+
+        data_read.skip(4)       # opacity_amount
+
+        if version != 1:
+            count = data_read.read_int32()
+            data_read.skip(count * 2)
 
 
     def write(self, writer):
@@ -55,14 +70,12 @@ class GMDCGroup:
         writer.write_byte_string(self.name)
 
         writer.write_int32( len(self.faces) )
-        for vert_ind in self.faces:
-            writer.write_int16(vert_ind)
+        writer.write_int16_array(self.faces)
 
         writer.write_int32(self.opacity_amount)
 
         writer.write_int32( len(self.subsets) )
-        for subset in self.subsets:
-            writer.write_int16(subset)
+        writer.write_int16_array(self.subsets)
 
 
     def build_data(b_models, bones):
@@ -75,17 +88,11 @@ class GMDCGroup:
             grp.link_index = i
             grp.name = mod.name
 
-            grp.faces = []
-            for f in mod.faces:
-                for val in f:
-                    grp.faces.append(val)
+            grp.faces = RawBlock.face_indices(mod.faces, 'Group ' + mod.name)
 
             grp.opacity_amount = mod.opacity_amount
 
-            grp.subsets = []
-            if bones:
-                for i in range(len(bones)):
-                    grp.subsets.append(i)
+            grp.subsets = np.arange(len(bones) if bones else 0, dtype=np.int16)
 
             groups.append(grp)
 
@@ -16,26 +16,31 @@ Created by SmugTomato
     You should have received a copy of the GNU General Public License
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 '''
+from .raw_block import RawBlock
 
 
-class GMDCHeader:
+class GMDCHeader(RawBlock):
 
 
+    __slots__ = ('language', 'string_style', 'repeat_value', 'index_value', 'file_type',
+                    'block_name', 'block_id', 'version', 'res_name', 'res_id',
+                    'res_version', 'file_name')
+
     def __init__(self, language, stringstyle, repeatval, indexval, filetype,
                         blockname, block_id, version, resname, res_id,
                         res_version, filename):
-        self.language           = language
-        self.string_style       = stringstyle
-        self.repeat_value       = repeatval
-        self.index_value        = indexval
-        self.file_type          = filetype
-        self.block_name         = blockname
-        self.block_id           = block_id
-        self.version            = version
-        self.res_name           = resname
-        self.res_id             = res_id
-        self.res_version        = res_version
-        self.file_name          = filename
+        self.language           = language      # int16
+        self.string_style       = stringstyle   # int16
+        self.repeat_value       = repeatval     # int
+        self.index_value        = indexval      # int
+        self.file_type          = filetype      # uint32, GMDC identifier
+        self.block_name         = blockname     # str
+        self.block_id           = block_id      # uint32
+        self.version            = version       # int
+        self.res_name           = resname       # str
+        self.res_id             = res_id        # int
+        self.res_version        = res_version   # int
+        self.file_name          = filename      # str
 
 
     @staticmethod
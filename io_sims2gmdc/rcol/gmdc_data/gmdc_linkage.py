@@ -16,68 +16,70 @@ Created by SmugTomato
     You should have received a copy of the GNU General Public License
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 '''
+import numpy as np
 
+from .raw_block import RawBlock
 
-class GMDCLinkage:
+
+class GMDCLinkage(RawBlock):
+
+    __slots__ = ('indices', 'ref_array_size', 'active_elements', 'submodel_vertices',
+                    'submodel_normals', 'submodel_uvs')
 
     def __init__(self):
-        self.indices            = None
+        self.indices            = None      # int16 array, linked element indices
 
-        self.ref_array_size     = None
-        self.active_elements    = None
+        self.ref_array_size     = None      # int, vertex count
+        self.active_elements    = None      # int
 
-        self.submodel_vertices  = None
+        self.submodel_vertices  = None      # int16 arrays
         self.submodel_normals   = None
         self.submodel_uvs       = None
 
     def read_data(self, data_read):
         count = data_read.read_int32()
-        self.indices = []
-        for i in range(0,count):
-            temp_val = data_read.read_int16()
-            self.indices.append(temp_val)
+        self.indices = data_read.read_int16_array(count)
 
         self.ref_array_size = data_read.read_int32()
         self.active_elements = data_read.read_int32()
 
         count = data_read.read_int32()
-        self.submodel_vertices = []
-        for i in range(0,count):
-            temp_val = data_read.read_int16()
-            self.submodel_vertices.append(temp_val)
+        self.submodel_vertices = data_read.read_int16_array(count)
 
         count = data_read.read_int32()
-        self.submodel_normals = []
-        for i in range(0,count):
-            temp_val = data_read.read_int16()
-            self.submodel_normals.append(temp_val)
+        self.submodel_normals = data_read.read_int16_array(count)
 
         count = data_read.read_int32()
-        self.submodel_uvs = []
-        for i in range(0,count):
-            temp_val = data_read.read_int16()
-            self.submodel_uvs.append(temp_val)
+        self.submodel_uvs = data_read.read_int16_array(count)
+
+
+    @staticmethod
+    def skip_data(data_read):
+        count = data_read.read_int32()
+        data_read.skip(count * 2)
+
+        data_read.skip(8)       # ref_array_size, active_elements
+
+        for i in range(3):      # submodel vertices, normals and uvs
+            count = data_read.read_int32()
+            data_read.skip(count * 2)
 
 
     def write(self, writer):
         writer.write_int32( len(self.indices) )
-        for ind in self.indices:
-            writer.write_int16(ind)
+        writer.write_int16_array(self.indices)
 
         writer.write_int32(self.ref_array_size)
         writer.write_int32(self.active_elements)
 
         writer.write_int32( len(self.submodel_vertices) )
-        for vert_ind in self.submodel_vertices:
-            writer.write_int16(vert_ind)
+        writer.write_int16_array(self.submodel_vertices)
 
         writer.write_int32( len(self.submodel_normals) )
-        for norm_ind in self.submodel_normals:
-            writer.write_int16(norm_ind)
+        writer.write_int16_array(self.submodel_normals)
 
-        writer.write_int32( len(self.submodel_normals) )
-        for uv_ind in self.submodel_uvs:
-            writer.write_int16(uv_ind)
+        writer.write_int32( len(self.submodel_uvs) )
+        writer.write_int16_array(self.submodel_uvs)
 
 
     @staticmethod
@@ -87,13 +89,13 @@ class GMDCLinkage:
         for i, mod in enumerate(b_models):
             linkage = GMDCLinkage()
 
-            linkage.indices = grplinks[i]
+            linkage.indices = np.asarray(grplinks[i], dtype=np.int16)
             linkage.ref_array_size = len(mod.vertices)
             linkage.active_elements = len(linkage.indices)
 
-            linkage.submodel_vertices = []
-            linkage.submodel_uvs = []
-            linkage.submodel_normals = []
+            linkage.submodel_vertices = np.empty(0, dtype=np.int16)
+            linkage.submodel_uvs = np.empty(0, dtype=np.int16)
+            linkage.submodel_normals = np.empty(0, dtype=np.int16)
 
             linkages.append(linkage)
 
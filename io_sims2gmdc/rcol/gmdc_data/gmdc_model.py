@@ -16,29 +16,31 @@ Created by SmugTomato
     You should have received a copy of the GNU General Public License
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 '''
+import numpy as np
 
+from .raw_block import RawBlock
 
-class GMDCModel:
+
+class GMDCModel(RawBlock):
 
     trans_block_vals    = 7    # quaternion(x,y,z,w) and transform(x,y,z) values
     name_pair_vals      = 2    # ['blend group name', 'assigned element name']
     vertex_coords       = 3    # position [x,y,z]
 
+    __slots__ = ('transforms', 'name_pairs', 'vertices', 'faces')
+
     def __init__(self):
-        self.transforms = None
-        self.name_pairs = None
-        self.vertices   = None
-        self.faces      = None
+        self.transforms = None      # List of 7 float lists, quaternion xyzw and translation
+        self.name_pairs = None      # List of [str, str] morph names
+        self.vertices   = None      # Bounding mesh, list of [x, y, z] float lists
+        self.faces      = None      # uint16 array, 3 vertex indices per face
 
     def read_data(self, data_read):
         count = data_read.read_int32()
+        values = data_read.read_float_array(count * GMDCModel.trans_block_vals)
         self.transforms = []
-        for i in range(0,count):
-            temp_block = []
-            for j in range(0,GMDCModel.trans_block_vals):
-                temp_val = data_read.read_float()
-                temp_block.append(temp_val)
-            self.transforms.append(temp_block)
+        for i in range(0, len(values), GMDCModel.trans_block_vals):
+            self.transforms.append( values[i:i + GMDCModel.trans_block_vals] )
 
         count = data_read.read_int32()
         self.name_pairs = []
@@ -54,24 +56,16 @@ class GMDCModel:
         if vert_count > 0:
             face_count = data_read.read_int32()
 
-            for i in range(0,vert_count):
-                temp_verts = []
-                for j in range(0,GMDCModel.vertex_coords):
-                    temp_vert = data_read.read_float()
-                    temp_verts.append(temp_vert)
-                self.vertices.append(temp_verts)
+            values = data_read.read_float_array(vert_count * GMDCModel.vertex_coords)
+            for i in range(0, len(values), GMDCModel.vertex_coords):
+                self.vertices.append( values[i:i + GMDCModel.vertex_coords] )
 
-            self.faces = []
-            for i in range(0,face_count):
-                temp_face = data_read.read_int16()
-                self.faces.append(temp_face)
+            self.faces = data_read.read_uint16_array(face_count)
 
 
     def write(self, writer):
         writer.write_int32( len(self.transforms) )
-        for transform in self.transforms:
-            for val in transform:
-                writer.write_float(val)
+        writer.write_float_array(self.transforms)
 
         writer.write_int32( len(self.name_pairs) )
         for pair in self.name_pairs:
@@ -84,13 +78,8 @@ class GMDCModel:
             return
 
         writer.write_int32( len(self.faces) )
-
-        for vert in self.vertices:
-            for val in vert:
-                writer.write_float(val)
-
-        for face_ind in self.faces:
-            writer.write_int16(face_ind)
+        writer.write_float_array(self.vertices)
+        writer.write_int16_array(self.faces)
 
 
     @staticmethod
@@ -123,11 +112,9 @@ class GMDCModel:
                 )
 
         model.vertices = []
-        model.faces = []
+        model.faces = np.empty(0, dtype=np.uint16)
         if boundmesh:
             model.vertices = boundmesh.vertices
-            for f in boundmesh.faces:
-                for ind in f:
-                    model.faces.append(ind)
+            model.faces = RawBlock.face_indices(boundmesh.faces, 'Bounding mesh')
 
         return model
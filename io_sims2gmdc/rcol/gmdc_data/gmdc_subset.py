@@ -16,15 +16,18 @@ Created by SmugTomato
     You should have received a copy of the GNU General Public License
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 '''
+from .raw_block import RawBlock
 
 
-class GMDCSubset:
+class GMDCSubset(RawBlock):
 
     vertex_coords = 3    # position [x,y,z]
 
+    __slots__ = ('vertices', 'faces')
+
     def __init__(self):
-        self.vertices   = None
-        self.faces      = None
+        self.vertices   = None      # List of [x, y, z] float lists
+        self.faces      = None      # uint16 array, 3 vertex indices per face
 
     def read_data(self, data_read):
         vert_count = data_read.read_int32()
@@ -32,17 +35,20 @@ class GMDCSubset:
         if vert_count > 0:
             face_count = data_read.read_int32()
 
-            for i in range(0,vert_count):
-                temp_verts = []
-                for i in range(0,GMDCSubset.vertex_coords):
-                    temp_val = data_read.read_float()
-                    temp_verts.append(temp_val)
-                self.vertices.append(temp_verts)
+            values = data_read.read_float_array(vert_count * GMDCSubset.vertex_coords)
+            for i in range(0, len(values), GMDCSubset.vertex_coords):
+                self.vertices.append( values[i:i + GMDCSubset.vertex_coords] )
 
-            self.faces = []
-            for i in range(0,face_count):
-                temp_val = data_read.read_int16()
-                self.faces.append(temp_val)
+            self.faces = data_read.read_uint16_array(face_count)
+
+
+    @staticmethod
+    def skip_data(data_read):
+        vert_count = data_read.read_int32()
+        if vert_count > 0:
+            face_count = data_read.read_int32()
+            data_read.skip(vert_count * GMDCSubset.vertex_coords * 4)
+            data_read.skip(face_count * 2)
 
 
     def write(self, writer):
@@ -51,12 +57,8 @@ class GMDCSubset:
             return
 
         writer.write_int32( len(self.faces) )
-        for vert in self.vertices:
-            for val in vert:
-                writer.write_float(val)
-
-        for vert_ind in self.faces:
-            writer.write_int16(vert_ind)
+        writer.write_float_array(self.vertices)
+        writer.write_int16_array(self.faces)
 
 
     @staticmethod
@@ -66,13 +68,9 @@ class GMDCSubset:
         if bones:
             for b in bones:
                 subset = GMDCSubset()
-                subset.vertices = []
-                subset.faces = []
-
                 subset.vertices = riggedbounds[b.subset].vertices
-                for f in riggedbounds[b.subset].faces:
-                    for idx in f:
-                        subset.faces.append(idx)
+                subset.faces = RawBlock.face_indices(riggedbounds[b.subset].faces,
+                                            'Bounding mesh of bone ' + b.name)
 
                 subsets.append(subset)
 
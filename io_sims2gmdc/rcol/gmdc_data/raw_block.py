@@ -0,0 +1,65 @@
+'''
+Copyright (C) 2018 SmugTomato
+
+Created by SmugTomato
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+import numpy as np
+
+
+class RawBlock:
+    """
+    Base for gmdc_data blocks that can be written back as the bytes they
+    were read from. Setting any attribute drops those bytes, so changed
+    blocks are encoded again. Edits made in place, like changing a value
+    in a face list or element array, need a call to mark_dirty().
+    """
+
+    __slots__ = ('raw',)        # Source bytes of an unchanged block, or None
+
+
+    def __setattr__(self, name, value):
+        if name != 'raw':
+            object.__setattr__(self, 'raw', None)
+        object.__setattr__(self, name, value)
+
+
+    def mark_dirty(self):
+        self.raw = None
+
+
+    def copy_or_write(self, writer):
+        """Copy the source bytes if the block is unchanged, encode it otherwise"""
+        if self.raw is not None:
+            writer.write_bytes(self.raw)
+        else:
+            self.write(writer)
+
+
+    @staticmethod
+    def face_indices(faces, owner):
+        """
+        Faces as a flat uint16 array of vertex indices. Face lists only
+        hold 16 bit indices, owner names the mesh in the error raised
+        for any index that doesn't fit.
+        """
+        faces = np.asarray(faces).reshape(-1)
+        if len(faces) and (faces.min() < 0 or faces.max() > 0xFFFF):
+            bad = faces[(faces < 0) | (faces > 0xFFFF)][0]
+            raise ValueError(
+                owner + ' uses vertex index ' + str(bad)
+                + ', face lists only hold indices 0 to 65535'
+            )
+        return faces.astype(np.uint16)
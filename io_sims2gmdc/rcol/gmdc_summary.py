@@ -0,0 +1,163 @@
+'''
+Copyright (C) 2018 SmugTomato
+
+Created by SmugTomato
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+import mmap
+import struct
+
+from .data_reader import DataReader
+from .gmdc_data.gmdc_header import GMDCHeader
+from .gmdc_data.gmdc_element import GMDCElement
+from .gmdc_data.gmdc_model import GMDCModel
+
+
+class GMDCSummary:
+    """Catalog record of a GMDC, read without decoding any payload arrays"""
+
+    # language, string style, repeat value and index value come before the file type
+    IDENTIFIER_OFFSET = 12
+
+
+    __slots__ = ('file_path', 'file_name', 'version', 'elements', 'group_names',
+                    'group_vertices', 'group_faces', 'bone_count', 'name_pairs')
+
+    def __init__(self, file_path, file_name, version, elements, group_names,
+                    group_vertices, group_faces, bone_count, name_pairs):
+        self.file_path      = file_path         # str
+        self.file_name      = file_name         # str, from the header
+        self.version        = version           # int
+        self.elements       = elements          # (identity, repetition) per element
+        self.group_names    = group_names       # str per group
+        self.group_vertices = group_vertices    # int per group
+        self.group_faces    = group_faces       # int per group
+        self.bone_count     = bone_count        # int
+        self.name_pairs     = name_pairs        # (str, str) per morph
+
+
+    @staticmethod
+    def is_gmdc(file, identifier):
+        peek = file.read(GMDCSummary.IDENTIFIER_OFFSET + 4)
+        if len(peek) < GMDCSummary.IDENTIFIER_OFFSET + 4:
+            return False
+        file_type = struct.unpack_from('<I', peek, GMDCSummary.IDENTIFIER_OFFSET)[0]
+        return file_type == identifier
+
+
+    @staticmethod
+    def from_file(file_path, identifier):
+        file = open(file_path, "rb")
+        if not GMDCSummary.is_gmdc(file, identifier):
+            file.close()
+            return None
+
+        file_data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        file.close()
+        data_read = DataReader(file_data, 0)
+        try:
+            return GMDCSummary.from_data(file_path, data_read)
+        finally:
+            data_read.file_data.release()
+            file_data.close()
+
+
+    @staticmethod
+    def from_data(file_path, data_read):
+        """
+        Raises ValueError for a file that ends before its sections do,
+        instead of the struct.error or IndexError of the read that failed
+        """
+        try:
+            summary = GMDCSummary.__read_sections(file_path, data_read)
+        except (struct.error, IndexError) as error:
+            raise ValueError('Truncated file ' + file_path + ': ' + str(error)) from error
+
+        # Skips aren't checked against the end of the file
+        if data_read.byte_offset > len(data_read.file_data):
+            raise ValueError('Truncated file ' + file_path + ': sections end past '
+                                + str(len(data_read.file_data)) + ' bytes')
+        return summary
+
+
+    @staticmethod
+    def __read_sections(file_path, data_read):
+        header = GMDCHeader.from_data(data_read)
+        if header.version != 4:
+            return None
+
+        # ELEMENTS
+        elements = []
+        count = data_read.read_int32()
+        for i in range(0,count):
+            element = GMDCElement.skip_data(data_read)
+            elements.append( (element.element_identity, element.identity_repitition) )
+
+        # LINKAGES, only the vertex count of each is needed
+        linkage_vertices = []
+        count = data_read.read_int32()
+        for i in range(0,count):
+            data_read.skip(data_read.read_int32() * 2)      # indices
+            linkage_vertices.append( data_read.read_int32() )
+            data_read.skip(4)                               # active_elements
+            for j in range(3):                              # submodel lists
+                data_read.skip(data_read.read_int32() * 2)
+
+        # GROUPS
+        group_names = []
+        group_vertices = []
+        group_faces = []
+        count = data_read.read_int32()
+        for i in range(0,count):
+            data_read.skip(4)                               # primitive_type
+            link_index = data_read.read_int32()
+            group_names.append( data_read.read_byte_string() )
+
+            face_count = data_read.read_int32()
+            data_read.skip(face_count * 2)
+            group_faces.append( face_count // 3 )
+            if not 0 <= link_index < len(linkage_vertices):
+                raise ValueError('group \'' + group_names[-1] + '\' has no linkage')
+            group_vertices.append( linkage_vertices[link_index] )
+
+            data_read.skip(4)                               # opacity_amount
+            data_read.skip(data_read.read_int32() * 2)      # subsets
+
+        # MODEL, skeleton size and morph names
+        bone_count = data_read.read_int32()
+        data_read.skip(bone_count * GMDCModel.trans_block_vals * 4)
+
+        name_pairs = []
+        count = data_read.read_int32()
+        for i in range(0,count):
+            name_pairs.append( (data_read.read_byte_string(), data_read.read_byte_string()) )
+
+        return GMDCSummary(file_path, header.file_name, header.version, elements,
+                            group_names, group_vertices, group_faces, bone_count,
+                            name_pairs)
+
+
+    def as_dict(self):
+        return {
+            'file_path':        self.file_path,
+            'file_name':        self.file_name,
+            'version':          self.version,
+            'elements':         [list(el) for el in self.elements],
+            'group_names':      self.group_names,
+            'group_vertices':   self.group_vertices,
+            'group_faces':      self.group_faces,
+            'bone_count':       self.bone_count,
+            'name_pairs':       [list(pair) for pair in self.name_pairs],
+        }
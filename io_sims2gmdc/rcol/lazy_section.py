@@ -0,0 +1,83 @@
+'''
+Copyright (C) 2018 SmugTomato
+
+Created by SmugTomato
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+from .data_reader import DataReader
+
+
+class LazySection:
+    """
+    Sequence of gmdc_data blocks that are only decoded the first time
+    they are accessed, using the byte span each block was found at
+    """
+
+    __slots__ = ('file_data', 'spans', 'block_type', 'read_args', 'skipped', 'blocks')
+
+    def __init__(self, file_data, spans, block_type, read_args, skipped=None):
+        self.file_data  = file_data     # bytes or memoryview of the whole file
+        self.spans      = spans         # list of (start, end) byte offsets, one per block
+        self.block_type = block_type    # RawBlock subclass the blocks are read as
+        self.read_args  = read_args     # tuple, extra arguments for read_data
+        self.skipped    = skipped       # list, what skip_data returned per block
+        self.blocks     = [None] * len(spans)   # list, decoded blocks, None until used
+
+
+    def __len__(self):
+        return len(self.spans)
+
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self.spans)))]
+
+        block = self.blocks[index]
+        if block is None:
+            start, end = self.spans[index]
+            data_read = DataReader(self.file_data, start)
+            block = self.block_type()
+            block.read_data(data_read, *self.read_args)
+            block.raw = self.file_data[start:end]
+            self.blocks[index] = block
+        return block
+
+
+    def __iter__(self):
+        for i in range(len(self.spans)):
+            yield self[i]
+
+
+    def is_loaded(self, index):
+        return self.blocks[index] is not None
+
+
+    def release(self, index):
+        """
+        Drop a decoded block, it is decoded again on the next access.
+        Blocks modified since they were decoded are kept.
+        """
+        block = self.blocks[index]
+        if block is not None and block.raw is not None:
+            self.blocks[index] = None
+
+
+    def write(self, writer):
+        """Write all blocks, the ones never accessed are copied without decoding"""
+        for (start, end), block in zip(self.spans, self.blocks):
+            if block is None:
+                writer.write_bytes(self.file_data[start:end])
+            else:
+                block.copy_or_write(writer)
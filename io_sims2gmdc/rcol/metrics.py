@@ -0,0 +1,126 @@
+'''
+Copyright (C) 2018 SmugTomato
+
+Created by SmugTomato
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+import cProfile
+import contextlib
+import json
+import time
+import tracemalloc
+
+
+class Metrics:
+    """
+    Opt-in per stage measurements: wall time, bytes processed, object
+    counts and peak traced allocation. Stages may be nested.
+    Before Python 3.9 the peak can't be reset, so it covers everything
+    traced up to the end of each stage.
+    """
+
+    def __init__(self, trace_memory=True, profile=False):
+        self.trace_memory   = trace_memory
+        self.profiler       = cProfile.Profile() if profile else None
+        self.stages         = []
+        self.__open         = []    # records of the stages currently running
+        self.__started_trace = False
+
+
+    @contextlib.contextmanager
+    def stage(self, name, **counts):
+        """Measure a block, the yielded record takes extra counts like 'bytes' or 'objects'"""
+        record = {'stage': name, 'depth': len(self.__open)}
+        record.update(counts)
+        self.stages.append(record)
+
+        if not self.__open:
+            self.__begin()
+        if self.trace_memory:
+            # Keep the peak seen so far for the enclosing stages before resetting
+            peak = tracemalloc.get_traced_memory()[1]
+            for parent in self.__open:
+                parent['peak_bytes'] = max(parent['peak_bytes'], peak)
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+            record['peak_bytes'] = 0
+
+        self.__open.append(record)
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['seconds'] = round(time.perf_counter() - start, 6)
+            self.__open.pop()
+
+            if self.trace_memory:
+                peak = max(record['peak_bytes'], tracemalloc.get_traced_memory()[1])
+                record['peak_bytes'] = peak
+                for parent in self.__open:
+                    parent['peak_bytes'] = max(parent['peak_bytes'], peak)
+            if not self.__open:
+                self.__end()
+
+
+    def __begin(self):
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.__started_trace = True
+        if self.profiler:
+            self.profiler.enable()
+
+    def __end(self):
+        if self.profiler:
+            self.profiler.disable()
+        if self.__started_trace:
+            tracemalloc.stop()
+            self.__started_trace = False
+
+
+    def as_dict(self):
+        return {'stages': self.stages}
+
+    def to_json(self, path):
+        with open(path, 'w') as file:
+            json.dump(self.as_dict(), file, indent=2)
+
+    def dump_profile(self, path):
+        if self.profiler:
+            self.profiler.dump_stats(path)
+
+
+    def save(self, path_prefix):
+        """Write <prefix>.metrics.json, and <prefix>.prof when profiling"""
+        self.to_json(path_prefix + '.metrics.json')
+        self.dump_profile(path_prefix + '.prof')
+        self.print()
+
+
+    def print(self):
+        for record in self.stages:
+            extra = ''
+            for key, value in record.items():
+                if key not in ('stage', 'depth', 'seconds'):
+                    extra += '  ' + key + ': ' + str(value)
+            print('    ' * record['depth'] + record['stage'] + ':',
+                    record.get('seconds'), 's' + extra)
+        print()
+
+
+def stage(metrics, name, **counts):
+    """Metrics.stage, or a no-op block when metrics is None"""
+    if metrics is None:
+        return contextlib.nullcontext(counts)
+    return metrics.stage(name, **counts)
@@ -0,0 +1,403 @@
+'''
+Copyright (C) 2018 SmugTomato
+
+Created by SmugTomato
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+import numpy as np
+
+
+# Values at most this far apart count as equal, the position one is
+# the threshold remove_doubles was used with
+POSITION_DISTANCE   = 0.001
+NORMAL_DISTANCE     = 0.001
+
+# Row pairs compared at once when neighbouring cells are checked row by row
+PAIR_BATCH          = 1 << 20
+
+
+def _sort_rows(keys):
+    """Lexicographic order of the rows of keys, and where a new distinct row starts"""
+    keys = np.asarray(keys).reshape(len(keys), -1)
+    order = np.lexsort(keys.T[::-1])
+    sorted_keys = keys[order]
+
+    starts = np.ones(len(keys), dtype=bool)
+    starts[1:] = np.any(sorted_keys[1:] != sorted_keys[:-1], axis=1)
+    return order, sorted_keys, starts
+
+
+def row_ids(keys):
+    """Number every distinct row of keys, equal rows get the same id"""
+    ids = np.empty(len(keys), dtype=np.int64)
+    if len(keys) == 0:
+        return ids
+
+    # Faster than np.unique(axis=0), which sorts the rows as raw bytes
+    order, sorted_keys, starts = _sort_rows(keys)
+    ids[order] = np.cumsum(starts) - 1
+    return ids
+
+
+def unique_rows(keys):
+    """Distinct rows of keys, in lexicographic order"""
+    if len(keys) == 0:
+        return np.asarray(keys)
+    order, sorted_keys, starts = _sort_rows(keys)
+    return sorted_keys[starts]
+
+
+def find_rows(table, rows):
+    """Index of every row of rows in table, whose rows are distinct, -1 if missing"""
+    ids = row_ids( np.concatenate((table, rows)) )
+    lookup = np.full(int(ids.max()) + 1, -1, dtype=np.int64)
+    lookup[ ids[:len(table)] ] = np.arange(len(table))
+    return lookup[ ids[len(table):] ]
+
+
+def _cell_strides(cells, reach):
+    """
+    (origin, strides) that turn every cell, and the cells up to reach
+    away from it, into a distinct integer key, or None if those don't
+    fit in an int64
+    """
+    origin = cells.min(axis=0) - reach
+    extents = [int(extent) for extent in cells.max(axis=0) - origin + reach + 1]
+    strides = [1]
+    for extent in extents[:0:-1]:
+        strides.insert(0, strides[0] * extent)
+    if strides[0] * extents[0] >= 2**62:
+        return None
+    return origin, np.array(strides, dtype=np.int64)
+
+
+def _half_neighbourhood(dimensions, reach):
+    """
+    Cell offsets up to reach away that come after (0, ..., 0). Every pair
+    of neighbouring cells is reached once.
+    """
+    steps = range(-reach, reach + 1)
+    grid = np.stack( np.meshgrid(*[steps] * dimensions, indexing='ij'), axis=-1 )
+    offsets = grid.reshape(-1, dimensions)
+    return offsets[len(offsets) // 2 + 1:]
+
+
+def _expand(starts, sizes):
+    """Owning range and position of every element of the ranges given by starts and sizes"""
+    owners = np.repeat(np.arange(len(sizes)), sizes)
+    within = np.arange(len(owners)) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+    return owners, np.repeat(starts, sizes) + within
+
+
+def _squared_lengths(vectors):
+    return np.einsum('ij,ij->i', vectors, vectors)
+
+
+def _close_cells(values, first, second, by_cell, cell_starts, cell_sizes, lows, highs, limit):
+    """
+    True for every cell pair with a row pair at most sqrt(limit) apart,
+    lows and highs are the bounds of the second cells
+    """
+    joined = np.zeros(len(first), dtype=bool)
+    if len(first) == 0:
+        return joined
+
+    # Every row of the first cells against the bounds of the second cell of its pair
+    pairs, positions = _expand(cell_starts[first], cell_sizes[first])
+    rows = by_cell[positions]
+    targets = second[pairs]
+    lows = lows[pairs]
+    highs = highs[pairs]
+    row_values = values[rows]
+    nearest = _squared_lengths( np.maximum(np.maximum(lows - row_values, row_values - highs), 0) )
+    farthest = _squared_lengths( np.maximum(row_values - lows, highs - row_values) )
+    joined[ pairs[farthest <= limit] ] = True
+
+    # The rest row by row, nearest rows of every pair first so close pairs
+    # are found and dropped early. In batches, dense cells would otherwise
+    # run out of memory.
+    keep = (nearest <= limit) & ~joined[pairs]
+    pairs, rows, targets, nearest = pairs[keep], rows[keep], targets[keep], nearest[keep]
+    order = np.lexsort( (nearest, pairs) )
+    ranks = np.empty(len(order), dtype=np.int64)
+    ranks[order] = np.arange(len(order)) - np.searchsorted(pairs[order], pairs[order])
+    order = np.argsort(ranks, kind='stable')
+    pairs, rows, targets = pairs[order], rows[order], targets[order]
+    ends = np.cumsum(cell_sizes[targets])
+
+    start = 0
+    while start < len(rows):
+        done = ends[start - 1] if start else 0
+        stop = max(int(np.searchsorted(ends, done + PAIR_BATCH, side='right')), start + 1)
+        batch = np.arange(start, stop)
+        batch = batch[ ~joined[pairs[batch]] ]
+        start = stop
+
+        owners, positions = _expand(cell_starts[targets[batch]], cell_sizes[targets[batch]])
+        close = _squared_lengths(values[rows[batch][owners]] - values[by_cell[positions]]) <= limit
+        joined[ pairs[batch][owners[close]] ] = True
+    return joined
+
+
+def cluster_ids(values, distance):
+    """
+    Number the rows of values so rows at most distance apart share a
+    number, chains of close rows included.
+
+    Equal rows are merged first. The rest are hashed into cells whose
+    diagonal is distance, so rows sharing a cell are always joined and
+    only neighbouring cells are compared. Cells whose bounds are entirely
+    close or entirely apart are settled without comparing their rows.
+    """
+    values = np.asarray(values, dtype=np.float64).reshape(len(values), -1)
+    count = len(values)
+    if count == 0:
+        return np.empty(0, dtype=np.int64)
+
+    # Flat shading repeats a handful of normals thousands of times
+    order, distinct, starts = _sort_rows(values)
+    ids = np.empty(count, dtype=np.int64)
+    ids[order] = np.cumsum(starts) - 1
+    distinct = distinct[starts]
+    if len(distinct) == 1 or distance <= 0:
+        return ids
+
+    dimensions = distinct.shape[1]
+    size = distance / np.sqrt(dimensions)
+    # Rows distance apart can be this many cells apart along an axis
+    reach = int(np.sqrt(dimensions)) + 1
+    limit = distance * distance
+
+    cells = np.floor(distinct / size).astype(np.int64)
+    strides = _cell_strides(cells, reach)
+    if strides is not None:
+        # Neighbours are found by key, a fixed offset away from the cell's own
+        origin, strides = strides
+        cell_keys, cell_ids = np.unique((cells - origin) @ strides, return_inverse=True)
+        cell_ids = cell_ids.reshape(-1)
+    else:
+        cell_ids = row_ids(cells)
+    cell_count = int(cell_ids.max()) + 1
+
+    cell_rows = np.empty((cell_count, dimensions), dtype=np.int64)
+    cell_rows[cell_ids] = cells
+    cell_sizes = np.bincount(cell_ids, minlength=cell_count)
+    cell_starts = np.cumsum(cell_sizes) - cell_sizes
+    by_cell = np.argsort(cell_ids, kind='stable')
+    lows = np.minimum.reduceat(distinct[by_cell], cell_starts, axis=0)
+    highs = np.maximum.reduceat(distinct[by_cell], cell_starts, axis=0)
+
+    # Squared gap along every axis between the rows of a cell and the
+    # cells -reach to reach steps away, neighbours out of range are skipped
+    steps = []
+    for step in range(-reach, reach + 1):
+        if step > 0:
+            gaps = (cell_rows + step) * size - highs
+        elif step < 0:
+            gaps = lows - (cell_rows + step + 1) * size
+        else:
+            gaps = np.zeros_like(lows)
+        steps.append( np.ascontiguousarray(np.maximum(gaps, 0).T ** 2) )
+
+    # Pairs of cells whose rows belong together
+    firsts = []
+    seconds = []
+    for offset in _half_neighbourhood(dimensions, reach):
+        gaps = sum(steps[step + reach][axis] for axis, step in enumerate(offset))
+        first = np.flatnonzero(gaps <= limit)
+        if len(first) == 0:
+            continue
+
+        if strides is None:
+            neighbours = find_rows(cell_rows, cell_rows[first] + offset)
+        else:
+            wanted = cell_keys[first] + offset @ strides
+            found = np.minimum(np.searchsorted(cell_keys, wanted), cell_count - 1)
+            neighbours = np.where(cell_keys[found] == wanted, found, -1)
+        first = first[neighbours >= 0]
+        second = neighbours[neighbours >= 0]
+
+        gaps = np.maximum(np.maximum(lows[second] - highs[first], lows[first] - highs[second]), 0)
+        near = _squared_lengths(gaps) <= limit
+        first = first[near]
+        second = second[near]
+
+        spans = np.maximum(highs[first], highs[second]) - np.minimum(lows[first], lows[second])
+        whole = _squared_lengths(spans) <= limit
+        firsts.append(first[whole])
+        seconds.append(second[whole])
+
+        first = first[~whole]
+        second = second[~whole]
+        joined = _close_cells(distinct, first, second, by_cell, cell_starts, cell_sizes,
+                                lows[second], highs[second], limit)
+        firsts.append(first[joined])
+        seconds.append(second[joined])
+    first = np.concatenate(firsts)
+    second = np.concatenate(seconds)
+
+    # Connected components, every cell ends up labelled with the lowest cell
+    labels = np.arange(cell_count)
+    while True:
+        low = np.minimum(labels[first], labels[second])
+        merged = labels.copy()
+        np.minimum.at(merged, first, low)
+        np.minimum.at(merged, second, low)
+        merged = merged[merged]
+        if np.array_equal(merged, labels):
+            break
+        labels = merged
+
+    return row_ids( labels[cell_ids][ids] )
+
+
+def face_edges(faces):
+    """Vertex index pair of every edge of every triangle, 3 per face"""
+    faces = np.asarray(faces).reshape(-1, 3)
+    return np.stack( (faces, np.roll(faces, -1, axis=1)), axis=2 ).reshape(-1, 2)
+
+
+class HardEdges:
+    """
+    Edges of a split-vertex triangle mesh that stay hard once vertices
+    at the same position are welded: edges where the faces sharing them
+    use different normals at an end point. Positions and normals closer
+    than their distance count as equal, so float noise does not split them.
+    """
+
+    __slots__ = ('position_ids', 'id_count', 'keys')
+
+    def __init__(self, position_ids, id_count, keys):
+        self.position_ids   = position_ids  # int64 array, welded position id per vertex
+        self.id_count       = id_count      # int, number of welded positions
+        self.keys           = keys          # int64 array, sorted keys of the hard edges
+
+
+    @staticmethod
+    def from_mesh(vertices, normals, faces, position_distance=POSITION_DISTANCE,
+                    normal_distance=NORMAL_DISTANCE, position_ids=None):
+        if position_ids is None:
+            position_ids = cluster_ids(vertices, position_distance)
+        normal_ids = cluster_ids(normals, normal_distance)
+        id_count = int(position_ids.max()) + 1 if len(position_ids) else 0
+
+        edges = face_edges(faces)
+        keys = HardEdges.__edge_keys(edges, position_ids, id_count)
+
+        # Distinct (edge, end point, normal) rows over every face edge
+        ends = np.stack( (
+            np.repeat(keys, 2),
+            position_ids[edges].reshape(-1),
+            normal_ids[edges].reshape(-1),
+        ), axis=1 )
+        ends = unique_rows(ends)
+
+        # Hard where the faces of an edge disagree on the normal of an end point
+        split = np.zeros(len(ends), dtype=bool)
+        split[1:] = np.all(ends[1:, :2] == ends[:-1, :2], axis=1)
+        return HardEdges(position_ids, id_count, np.unique(ends[split, 0]))
+
+
+    def __len__(self):
+        return len(self.keys)
+
+
+    def mask(self, edges):
+        """
+        True for every hard edge in edges, given as vertex index pairs
+        of the mesh this was made from
+        """
+        edges = np.asarray(edges).reshape(-1, 2)
+        return np.isin(HardEdges.__edge_keys(edges, self.position_ids, self.id_count), self.keys)
+
+
+    @staticmethod
+    def __edge_keys(edges, position_ids, id_count):
+        # The same for both directions of an edge
+        ends = np.sort(position_ids[edges], axis=1)
+        return ends[:, 0] * id_count + ends[:, 1]
+
+
+class WeldedMesh:
+    """
+    Triangle mesh with the vertices at most POSITION_DISTANCE apart
+    welded into one, like remove_doubles did. Faces that collapse and vertices no face uses are
+    dropped. Every welded vertex and every loop keeps the index of the
+    source vertex it came from, so per vertex data like UVs, normals and
+    morph deltas can be gathered from the source arrays.
+    """
+
+    __slots__ = ('vertices', 'faces', 'vertex_sources', 'loop_sources',
+                    'welded_index', 'position_ids')
+
+    def __init__(self, vertices, faces, vertex_sources, loop_sources,
+                    welded_index, position_ids):
+        self.vertices       = vertices          # (n, 3) array, positions
+        self.faces          = faces             # (n, 3) int64 array, welded vertex indices
+        self.vertex_sources = vertex_sources    # int64 array, source vertex per welded vertex
+        self.loop_sources   = loop_sources      # int64 array, source vertex per face corner
+        self.welded_index   = welded_index      # int64 array, welded vertex per source vertex, -1 if dropped
+        self.position_ids   = position_ids      # int64 array, welded position id per source vertex
+
+
+    @staticmethod
+    def from_mesh(vertices, faces, position_distance=POSITION_DISTANCE):
+        vertices = np.asarray(vertices)
+        faces = np.asarray(faces, dtype=np.int64).reshape(-1, 3)
+        position_ids = cluster_ids(vertices, position_distance)
+
+        # Drop faces that lose a corner to welding
+        welded_faces = position_ids[faces]
+        keep = ( (welded_faces[:, 0] != welded_faces[:, 1])
+                & (welded_faces[:, 1] != welded_faces[:, 2])
+                & (welded_faces[:, 2] != welded_faces[:, 0]) )
+        faces = faces[keep]
+        welded_faces = welded_faces[keep]
+
+        # Only positions used by a face become vertices, numbered in order of
+        # their first source vertex. That source vertex provides their data.
+        id_count = int(position_ids.max()) + 1 if len(position_ids) else 0
+        used = np.zeros(id_count, dtype=bool)
+        used[welded_faces.reshape(-1)] = True
+
+        first_source = np.full(id_count, len(vertices), dtype=np.int64)
+        np.minimum.at(first_source, position_ids, np.arange(len(vertices)))
+        vertex_sources = np.sort(first_source[used])
+
+        id_to_welded = np.full(id_count, -1, dtype=np.int64)
+        id_to_welded[ position_ids[vertex_sources] ] = np.arange(len(vertex_sources))
+
+        return WeldedMesh(
+            vertices[vertex_sources],
+            id_to_welded[welded_faces],
+            vertex_sources,
+            faces.reshape(-1),
+            id_to_welded[position_ids],
+            position_ids,
+        )
+
+
+    def source_vertices(self, indices):
+        """
+        Welded indices for the given source vertices, leaving out the ones
+        that are not the source of their welded vertex. Use this to move
+        per vertex data that must not be counted twice, like bone weights.
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        welded = self.welded_index[indices]
+        keep = welded >= 0
+        keep[keep] = self.vertex_sources[ welded[keep] ] == indices[keep]
+        return welded[keep]
+
@@ -1,5 +1,5 @@
 import bpy
-from mathutils import Vector
+import numpy as np
 from rna_prop_ui import rna_idprop_ui_prop_get
 from bpy.props import (StringProperty,
                        BoolProperty,
@@ -13,6 +13,8 @@ from bpy.types import (Panel,
                        PropertyGroup,
                        )
 
+from .blender_model import BlenderModel
+
 
 NECKFIX = {
     'NONE':   -1,
@@ -356,19 +358,12 @@ class OP_NormalsToVertexColor(bpy.types.Operator):
         if '__NORMALS__' not in mesh.vertex_colors:
             mesh.vertex_colors.new(name = "__NORMALS__")
         color_map = mesh.vertex_colors['__NORMALS__']
-        
-        for loop in mesh.loops:
-            i = loop.index
-    
-            # Convert Loop normal to a valid colour.
-            normal = Vector(loop.normal)
-            normal.normalize()
-    
-            rgb = ( normal + Vector((1.0, 1.0, 1.0)) ) * 0.5
-            rgba = rgb.to_4d()
-    
-            # Set Vertex color to new color
-            color_map.data[loop.index].color = rgba
+
+        # Convert Loop normals to valid colours
+        normals = np.empty(len(mesh.loops) * 3, dtype=np.float32)
+        mesh.loops.foreach_get("normal", normals)
+        colors = BlenderModel.normals_to_colors(normals)
+        color_map.data.foreach_set("color", colors.reshape(-1))
         
         return {'FINISHED'}
 # </editor-fold> -- END PROPERTIES
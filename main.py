@@ -1,32 +1,245 @@
-# from .gmdc_data import *
-# from .element_id import ElementID
-# from .blender_model import BlenderModel
+"""
+Headless batch tools for Sims 2 GMDC(.5gd) files.
+
+Runs without Blender, only the rcol core of the add-on is used. Every
+input file is handled by a worker process and produces one JSON line in
+the report.
+
+    python main.py validate  sims2_files/
+    python main.py dump      sims2_files/ --report catalog.jsonl
+    python main.py roundtrip sims2_files/ -o rewritten/ -j 8
+    python main.py convert   sims2_files/ -o obj/ --chunk-size 32
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
 
 from io_sims2gmdc.rcol.gmdc import GMDC
-# from io_sims2gmdc.rcol.data_helper import DataHelper
-from io_sims2gmdc.bone_data import BoneData
-from io_sims2gmdc.element_id import element_ids
-from io_sims2gmdc.element_id import ElementID
+from io_sims2gmdc.rcol.gmdc_data.gmdc_element import GMDCElement
+from io_sims2gmdc.rcol.metrics import Metrics
+
+
+def find_files(paths):
+    """Yield (file path, path relative to its input root) for every .5gd"""
+    for root in paths:
+        if os.path.isfile(root):
+            yield root, os.path.basename(root)
+            continue
+
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames.sort()
+            for name in sorted(filenames):
+                if name.lower().endswith('.5gd'):
+                    path = os.path.join(dirpath, name)
+                    yield path, os.path.relpath(path, root)
+
+
+def load_gmdc(path, metrics=None):
+    gmdc_data = GMDC.from_file_data(path, metrics=metrics)
+    if gmdc_data.load_header() == False:
+        raise ValueError(gmdc_data.unsupported_reason())
+    gmdc_data.load_data()
+    return gmdc_data
+
+
+def output_path(output, relpath, extension):
+    path = os.path.join(output, os.path.splitext(relpath)[0] + extension)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    return path
+
+
+# <editor-fold> -- OPERATIONS
+def validate(gmdc_data, path, relpath, output):
+    problems = []
+
+    if gmdc_data.data_read.byte_offset != len(gmdc_data.data_read.file_data):
+        problems.append('trailing data after subsets section')
+
+    for i, linkage in enumerate(gmdc_data.linkages):
+        for ind in linkage.indices:
+            if not 0 <= ind < len(gmdc_data.elements):
+                problems.append('linkage ' + str(i) + ' links missing element ' + str(ind))
+
+    for group in gmdc_data.groups:
+        if not 0 <= group.link_index < len(gmdc_data.linkages):
+            problems.append('group \'' + group.name + '\' has no linkage')
+            continue
+
+        if len(group.faces) % 3 != 0:
+            problems.append('group \'' + group.name + '\' face list is not made of triangles')
+
+        vertex_count = gmdc_data.linkages[group.link_index].ref_array_size
+        faces = np.asarray(group.faces)
+        if len(faces) and (faces.min() < 0 or faces.max() >= vertex_count):
+            problems.append('group \'' + group.name + '\' references missing vertices')
+
+    return {'ok': not problems, 'problems': problems}
+
+
+def dump(gmdc_data, path, relpath, output):
+    summary = GMDC.scan(path)
+    if summary is None:
+        raise ValueError('Not a version 4 GMDC')
+    return {'ok': True, 'summary': summary.as_dict()}
+
+
+def roundtrip(gmdc_data, path, relpath, output):
+    """
+    Encode every block again and compare with the source file. Unchanged
+    blocks would otherwise be copied as they were read, see RawBlock.
+    """
+    gmdc_data.mark_dirty()
+
+    if output:
+        out_path = output_path(output, relpath, '.5gd')
+    else:
+        handle, out_path = tempfile.mkstemp(suffix='.5gd')
+        os.close(handle)
+
+    try:
+        gmdc_data.write(out_path)
+        with open(path, 'rb') as source, open(out_path, 'rb') as result:
+            identical = source.read() == result.read()
+    finally:
+        if not output:
+            os.remove(out_path)
+
+    return {'ok': identical, 'identical': identical}
+
+
+def convert(gmdc_data, path, relpath, output):
+    """Write all groups to a Wavefront OBJ, coordinates as stored in the GMDC"""
+    obj_path = output_path(output, relpath, '.obj')
+    # OBJ indices count every v, vt and vn line of the file separately
+    vert_offset = 1
+    uv_offset = 1
+    normal_offset = 1
+
+    with open(obj_path, 'w') as file:
+        file.write('# ' + gmdc_data.header.file_name + '\n')
+
+        for group in gmdc_data.groups:
+            vertices = gmdc_data.linked_element(group.link_index, GMDCElement.VERTICES)
+            normals = gmdc_data.linked_element(group.link_index, GMDCElement.NORMALS_LIST)
+            uvs = gmdc_data.linked_element(group.link_index, GMDCElement.UV_COORDINATES)
+            if vertices is None:
+                continue
+
+            file.write('o ' + group.name + '\n')
+            np.savetxt(file, vertices.element_values, fmt='v %.6f %.6f %.6f')
+
+            faces = np.asarray(group.faces, dtype=np.int64).reshape(-1, 3)
+            # Vertex, then UV and normal index of every corner
+            corners = [faces + vert_offset]
+            vert_offset += len(vertices.element_values)
+
+            face_format = '%d'
+            if uvs is not None:
+                uv_values = np.array(uvs.element_values)
+                uv_values[:,1] = 1 - uv_values[:,1]
+                np.savetxt(file, uv_values, fmt='vt %.6f %.6f')
+                face_format += '/%d'
+                corners.append(faces + uv_offset)
+                uv_offset += len(uv_values)
+            if normals is not None:
+                np.savetxt(file, normals.element_values, fmt='vn %.6f %.6f %.6f')
+                face_format += '/%d' if uvs is not None else '//%d'
+                corners.append(faces + normal_offset)
+                normal_offset += len(normals.element_values)
+
+            faces = np.stack(corners, axis=2).reshape(len(faces), -1)
+            np.savetxt(file, faces, fmt='f ' + ' '.join([face_format] * 3))
+
+    return {'ok': True, 'output': obj_path}
+
+
+OPERATIONS = {
+    'validate':     validate,
+    'dump':         dump,
+    'roundtrip':    roundtrip,
+    'convert':      convert,
+}
+# </editor-fold> -- END OPERATIONS
+
+
+def process_file(operation, output, with_metrics, item):
+    path, relpath = item
+    record = {'path': path, 'operation': operation}
+    metrics = Metrics(trace_memory=False) if with_metrics else None
+    start = time.perf_counter()
+
+    try:
+        record['bytes'] = os.path.getsize(path)
+        # GMDC prints its progress, keep it out of a report written to stdout
+        with contextlib.redirect_stdout(sys.stderr):
+            gmdc_data = None
+            if operation != 'dump':
+                # dump only needs the section directory, skip the full parse
+                gmdc_data = load_gmdc(path, metrics)
+            record.update( OPERATIONS[operation](gmdc_data, path, relpath, output) )
+    except Exception as error:
+        record['ok'] = False
+        record['error'] = type(error).__name__ + ': ' + str(error)
+
+    record['seconds'] = round(time.perf_counter() - start, 6)
+    if metrics:
+        record['metrics'] = metrics.as_dict()['stages']
+    return record
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Batch process Sims 2 GMDC(.5gd) files without Blender.')
+    parser.add_argument('operation', choices=list(OPERATIONS))
+    parser.add_argument('paths', nargs='+', help='.5gd files or directories to search')
+    parser.add_argument('-o', '--output', help='output directory for roundtrip and convert')
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count(),
+                        help='worker processes, 1 runs everything in this process')
+    parser.add_argument('--chunk-size', type=int, default=16,
+                        help='files handed to a worker at a time')
+    parser.add_argument('--report', default='-', help='JSON lines report file, - for stdout')
+    parser.add_argument('--metrics', action='store_true',
+                        help='add per section timings to every report line')
+    args = parser.parse_args(argv)
 
-# from io_sims2gmdc.rcol.rcol_data import Rcol
-from io_sims2gmdc.blender_model import BlenderModel
-import struct
+    if args.operation == 'convert' and not args.output:
+        parser.error('convert needs an --output directory')
 
+    files = list(find_files(args.paths))
+    work = partial(process_file, args.operation, args.output, args.metrics)
 
-def main():
-    testgmdc = GMDC.from_file_data('sims2_files/Table/Tbale_Mesh.5gd')
-    testgmdc.load_header()
-    testgmdc.load_data()
+    report = sys.stdout if args.report == '-' else open(args.report, 'w')
+    failed = 0
+    start = time.perf_counter()
 
-    testmod = BlenderModel.from_gmdc(testgmdc, testgmdc, 0)
+    executor = None
+    try:
+        if args.workers == 1:
+            results = map(work, files)
+        else:
+            executor = ProcessPoolExecutor(max_workers=args.workers)
+            results = executor.map(work, files, chunksize=max(1, args.chunk_size))
 
-    for grp in testgmdc.groups:
-        print( 'Link index:\t', grp.link_index )
-        print( 'Name:\t\t', grp.name )
-        print( 'Faces:\t\t', len(grp.faces) )
-    print(len(testgmdc.elements))
-    print()
+        for record in results:
+            failed += not record['ok']
+            report.write(json.dumps(record) + '\n')
+    finally:
+        if executor:
+            executor.shutdown()
+        if report is not sys.stdout:
+            report.close()
 
+    print(len(files), 'files,', failed, 'failed in',
+            round(time.perf_counter() - start, 2), 'seconds', file=sys.stderr)
+    return 1 if failed else 0
 
 
-main()
+if __name__ == '__main__':
+    sys.exit(main())